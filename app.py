@@ -1,21 +1,24 @@
 import streamlit as st
 import os
-import glob
-from io import BytesIO
+import time
 
 from auth import init_db, register_user, validate_user
-from utils import extract_pdf_text, export_docx, export_pdf, export_ppt
-from nlp import (
-    summarize_text,
-    section_wise_summaries,
-    create_question_bank,
-    create_written_answer_questions,
-    create_ppt_outline,
-    generate_group_assignments,
-)
+from cache import estimate_tokens, hash_bytes
+from preprocess import cached_preprocess
+from utils import EXTRACT_CACHE, EXTRACT_WORKERS, cached_export, count_pdf_pages, iter_pdf_pages
+import metrics
+import revisions
+import storage
+import structured
 
 # ============= SETUP =============
 
+# Offer to start generating before extraction finishes on long documents
+EARLY_START_MIN_PAGES = 20
+EARLY_START_MIN_CHARS = 4000
+
+FILES_PER_PAGE = 20
+
 st.set_page_config(page_title="EDUSAGE - AI Academic Assistant", layout="centered")
 
 def local_css(file_name):
@@ -54,6 +57,7 @@ st.markdown(
     unsafe_allow_html=True,
 )
 init_db()
+metrics.start_exporters()
 
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -74,33 +78,329 @@ if "modal_title" not in st.session_state:
     st.session_state.modal_title = ""
 if "show_modal" not in st.session_state:
     st.session_state.show_modal = False
+if "extraction" not in st.session_state:
+    st.session_state.extraction = {}
+if "jobs" not in st.session_state:
+    st.session_state.jobs = {}
+if "revision" not in st.session_state:
+    st.session_state.revision = {}
+if "job_errors" not in st.session_state:
+    st.session_state.job_errors = {}
 
-def save_user_file(filename: str, content) -> str:
-    user_dir = f"user_files/{st.session_state.username}"
-    os.makedirs(user_dir, exist_ok=True)
-    path = os.path.join(user_dir, filename)
-    if isinstance(content, BytesIO):
-        with open(path, "wb") as f:
-            f.write(content.getvalue())
-    else:
-        if isinstance(content, (bytes, bytearray)):
-            with open(path, "wb") as f:
-                f.write(content)
+def download_artifact(label: str, filename: str, text: str):
+    """Serves a generated artifact from the export cache instead of from disk."""
+    try:
+        data = cached_export(storage.FORMATS[filename], text, storage.KINDS[filename])
+    except Exception as e:
+        st.error(f"❌ Couldn't create {filename}: {e}")
+        return
+    st.download_button(label, data, file_name=filename)
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def start_job(key: str, text: str, source: str):
+    st.session_state.job_errors.pop(key, None)
+    st.session_state.jobs[key] = JOBS.submit(
+        st.session_state.username, key, text, source=source, force=st.session_state.force_fresh,
+        incremental=is_incremental(),
+    )
+    st.rerun()
+
+def is_incremental() -> bool:
+    """Whether the current upload revises a chunked document, and is chunked the same way to reuse its responses."""
+    return bool(st.session_state.revision.get("incremental"))
+
+def poll_job(key: str):
+    """
+    Collects a finished background job into st.session_state.generated, or
+    its error into st.session_state.job_errors (see show_job_error).
+    Returns the job while it is still queued or running, else None.
+    """
+    job_id = st.session_state.jobs.get(key)
+    if not job_id:
+        return None
+    job = JOBS.get(job_id)
+    if job and job["status"] not in (DONE, FAILED):
+        return job
+
+    del st.session_state.jobs[key]
+    if job and job["status"] == DONE:
+        st.session_state.generated[key] = job["result"]
+    elif job:
+        # Kept until the next attempt: a rerun would wipe an st.error shown here
+        st.session_state.job_errors[key] = job["error"]
+    return None
+
+def show_job_error(key: str):
+    error = st.session_state.job_errors.get(key)
+    if error:
+        st.error(f"❌ Generation failed: {error}")
+
+def show_job_progress(job, message: str):
+    st.info(f"⏳ {message} You can keep using the app meanwhile.")
+    if job["result"] and job["feature"] in structured.FEATURE_KINDS:
+        # Half-written JSON isn't readable: show the items complete so far
+        kind = structured.FEATURE_KINDS[job["feature"]]
+        items = structured.partial_items(kind, job["result"])
+        if items:
+            st.caption(f"{len(items)} {structured.ITEMS[kind]} so far...")
+            st.markdown(structured.to_text({"kind": kind, structured.ITEMS[kind]: items}))
         else:
+            st.caption(f"{len(job['result']):,} characters received...")
+    elif job["result"]:
+        st.markdown(job["result"])
+
+def show_revision(name: str, source: str, text: str):
+    """Records the upload as a revision of the user's documents and says what changed since the last one."""
+    revision = st.session_state.revision
+    if revision.get("source") != source or revision.get("chars") != len(text):
+        revision = st.session_state.revision = {
+            "source": source,
+            "chars": len(text),
+            **revisions.record(
+                st.session_state.username, name, source, text, chunked=estimate_tokens(text) > CHUNK_TOKENS
+            ),
+        }
+    if not revision["parent"]:
+        return
+    uploaded = time.strftime("%Y-%m-%d %H:%M", time.localtime(revision["parent_created"]))
+    changed = len(revision["changed"])
+    if not changed:
+        st.info(f"📑 Same content as {revision['parent_name']} (uploaded {uploaded}).")
+    else:
+        # Revisions of chunked documents are chunked too, and unchanged chunks come from the response cache
+        reuse = " Only the parts around them are sent to the model again." if (
+            revision.get("incremental") and INCREMENTAL_CHUNK_TOKENS
+        ) else ""
+        st.info(
+            f"📑 Revision of {revision['parent_name']} (uploaded {uploaded}): "
+            f"{changed} of {revision['pages']} pages changed.{reuse}"
+        )
+
+def artifact_text(key: str) -> str:
+    """A generated artifact as readable text (structured results are rendered)."""
+    content = st.session_state.generated.get(key)
+    model = structured.load(key, content)
+    return content if model is None else structured.to_text(model)
+
+def regenerate_picker(key: str, text: str, source: str):
+    """Lets the user replace selected items of a structured artifact instead of redoing all of it."""
+    model = structured.load(key, st.session_state.generated.get(key))
+    if model is None:
+        return
+    count = len(structured.items(model))
+    picked = st.multiselect(
+        "Regenerate selected items",
+        range(count),
+        format_func=lambda i: structured.label(model, i),
+        key=f"regen_pick_{key}",
+    )
+    if picked and st.button("♻️ Regenerate selected", key=f"regen_{key}"):
+        with st.spinner(f"Regenerating {len(picked)} of {count}..."):
             try:
-                data = content.read()
-                with open(path, "wb") as f:
-                    f.write(data)
-            except Exception:
-                with open(path, "wb") as f:
-                    f.write(str(content).encode("utf-8"))
-    return path
-
-def list_user_files():
-    user_dir = f"user_files/{st.session_state.username}"
-    os.makedirs(user_dir, exist_ok=True)
-    files = sorted(glob.glob(os.path.join(user_dir, "*")))
-    return files
+                updated = structured.dumps(regenerate_items(key, text, model, picked))
+            except Exception as e:
+                st.error(f"❌ Regeneration failed: {e}")
+                return
+        st.session_state.generated[key] = updated
+        storage.save_exports(st.session_state.username, key, updated, source)
+        st.session_state.pop(f"regen_pick_{key}", None)
+        st.rerun()
+
+def job_sections(pdf_text: str, pdf_hash: str):
+    """
+    The feature sections. While this session has jobs running they are run
+    as a fragment every second to poll them; once one finishes the whole
+    app reruns, so the sidebar lists its files and polling stops when none are left.
+    """
+    running = set(st.session_state.jobs)
+    for key in running:
+        poll_job(key)
+
+    # Summary Notes
+    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+    st.markdown('<div class="section-card">', unsafe_allow_html=True)
+    cols = st.columns([8, 2])
+    with cols[0]:
+        st.subheader("📄 Summary Notes")
+    job = poll_job("notes")
+    with cols[1]:
+        if job:
+            st.caption("⏳ Working...")
+        elif st.session_state.force_fresh or not st.session_state.generated.get("notes"):
+            if st.button("Generate", key="gen_notes"):
+                start_job("notes", pdf_text, pdf_hash)
+        else:
+            if st.button("🔍 Preview", key="preview_notes_btn"):
+                show_preview_modal("📄 Summary Notes Preview", st.session_state.generated["notes"])
+    if job:
+        show_job_progress(job, "Generating summary notes...")
+    show_job_error("notes")
+    notes = st.session_state.generated.get("notes")
+    if notes:
+        download_artifact("Download DOCX", "notes.docx", notes)
+    st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+
+    # Presentation Slides
+    st.markdown('<div class="section-card">', unsafe_allow_html=True)
+    cols = st.columns([8, 2])
+    with cols[0]:
+        st.subheader("📅 Presentation Slides")
+    job = poll_job("ppt")
+    with cols[1]:
+        if job:
+            st.caption("⏳ Working...")
+        elif st.session_state.force_fresh or not st.session_state.generated.get("ppt"):
+            if st.button("Generate", key="gen_ppt"):
+                start_job("ppt", pdf_text, pdf_hash)
+        else:
+            if st.button("🔍 Preview", key="preview_ppt_btn"):
+                show_preview_modal("📅 PPT Outline Preview", artifact_text("ppt"))
+    if job:
+        show_job_progress(job, "Generating PPT outline...")
+    show_job_error("ppt")
+    ppt_text = st.session_state.generated.get("ppt")
+    if ppt_text:
+        download_artifact("Download PPTX", "slides.pptx", ppt_text)
+        regenerate_picker("ppt", pdf_text, pdf_hash)
+    st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+
+    # Research Summary
+    st.markdown('<div class="section-card">', unsafe_allow_html=True)
+    cols = st.columns([8, 2])
+    with cols[0]:
+        st.subheader("📚 Research Summary")
+    job = poll_job("sections")
+    with cols[1]:
+        if job:
+            st.caption("⏳ Working...")
+        elif st.session_state.force_fresh or not st.session_state.generated.get("sections"):
+            if st.button("Generate", key="gen_sec"):
+                start_job("sections", pdf_text, pdf_hash)
+        else:
+            if st.button("🔍 Preview", key="preview_sections_btn"):
+                show_preview_modal("📚 Research Summary Preview", st.session_state.generated["sections"])
+    if job:
+        show_job_progress(job, "Generating section summaries...")
+    show_job_error("sections")
+    sec_text = st.session_state.generated.get("sections")
+    if sec_text:
+        download_artifact("Download PDF", "section_summaries.pdf", sec_text)
+    st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+
+    # Question Bank
+    st.markdown('<div class="section-card">', unsafe_allow_html=True)
+    cols = st.columns([8, 2])
+    with cols[0]:
+        st.subheader("🧾 Question Bank")
+        qtype = st.radio("Type", ["MCQs", "Written"], key="qtype_radio")
+        key_name = "questions_mcq" if qtype == "MCQs" else "questions_written"
+    job = poll_job(key_name)
+    with cols[1]:
+        if job:
+            st.caption("⏳ Working...")
+        elif st.session_state.force_fresh or not st.session_state.generated.get(key_name):
+            if st.button("Generate", key="gen_questions"):
+                start_job(key_name, pdf_text, pdf_hash)
+        else:
+            if st.button("🔍 Preview", key="preview_questions_btn"):
+                show_preview_modal(f"🧾 {qtype} Preview", artifact_text(key_name))
+    if job:
+        show_job_progress(job, "Generating questions...")
+    show_job_error(key_name)
+    qtext = st.session_state.generated.get(key_name)
+    if qtext:
+        if qtype == "MCQs":
+            download_artifact("Download MCQs (DOCX)", "questions.docx", qtext)
+        else:
+            download_artifact("Download Written (DOCX)", "written_answer_questions.docx", qtext)
+            download_artifact("Download Written (PDF)", "written_answer_questions.pdf", qtext)
+        regenerate_picker(key_name, pdf_text, pdf_hash)
+    st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+
+    # Assignment Generator
+    st.markdown('<div class="section-card">', unsafe_allow_html=True)
+    cols = st.columns([8, 2])
+    with cols[0]:
+        st.subheader("📝 Assignment Generator")
+    job = poll_job("assignments")
+    with cols[1]:
+        if job:
+            st.caption("⏳ Working...")
+        elif st.session_state.force_fresh or not st.session_state.generated.get("assignments"):
+            if st.button("Generate", key="gen_assignments"):
+                start_job("assignments", pdf_text, pdf_hash)
+        else:
+            if st.button("🔍 Preview", key="preview_assignments_btn"):
+                show_preview_modal("📝 Assignment Generator Preview", st.session_state.generated["assignments"])
+    if job:
+        show_job_progress(job, "Creating assignments...")
+    show_job_error("assignments")
+    ass_text = st.session_state.generated.get("assignments")
+    if ass_text:
+        download_artifact("Download DOCX", "assignments_all_groups.docx", ass_text)
+        download_artifact("Download PDF", "assignments_all_groups.pdf", ass_text)
+    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+
+    if set(st.session_state.jobs) != running:
+        st.rerun()
+
+def extract_with_progress(pdf_bytes: bytes, pdf_hash: str):
+    """
+    Extracts the upload page by page behind a progress bar. Progress lives in
+    session state, so a rerun mid-extraction resumes instead of restarting,
+    and long documents can be used before the last page is done.
+    """
+    text = EXTRACT_CACHE.get(pdf_hash)
+    if text is not None:
+        return text
+
+    state = st.session_state.extraction
+    if state.get("hash") != pdf_hash:
+        state = st.session_state.extraction = {
+            "hash": pdf_hash,
+            "total": count_pdf_pages(pdf_bytes),
+            "done": 0,
+            "pages": [],
+            "partial": False,
+        }
+
+    if state["partial"]:
+        st.info(f"Using text from pages 1–{state['done']} of {state['total']}.")
+        if st.button("Extract remaining pages", key="extract_rest"):
+            state["partial"] = False
+            st.rerun()
+        return "\n\n".join(state["pages"])
+
+    if state["total"] >= EARLY_START_MIN_PAGES:
+        if st.button("⚡ Start with the pages extracted so far", key="extract_early"):
+            if sum(len(p) for p in state["pages"]) >= EARLY_START_MIN_CHARS:
+                state["partial"] = True
+                st.rerun()
+            st.warning("Not enough text extracted yet — continuing.")
+
+    progress = st.progress(state["done"] / max(state["total"], 1), text="Extracting text from PDF...")
+    for number, page_text in iter_pdf_pages(pdf_bytes, start=state["done"], workers=EXTRACT_WORKERS):
+        if page_text is not None:
+            state["pages"].append(page_text)
+        state["done"] = number
+        progress.progress(number / state["total"], text=f"Extracting text from PDF... page {number} of {state['total']}")
+    progress.empty()
+
+    text = "\n\n".join(state["pages"])
+    EXTRACT_CACHE.put(pdf_hash, text)
+    st.session_state.extraction = {}
+    return text
 
 def show_preview_modal(title: str, content: str):
     st.session_state.modal_title = title
@@ -115,7 +415,8 @@ def login_register_ui():
         email = st.text_input("Email", key="login_email", placeholder="you@example.com")
         password = st.text_input("Password", type="password", key="login_pass", placeholder="••••••••")
         if st.button("Sign In", key="login_btn"):
-            username = validate_user(email, password)
+            with st.spinner("Signing in..."):
+                username = validate_user(email, password)
             if username:
                 st.session_state.logged_in = True
                 st.session_state.username = username
@@ -127,7 +428,8 @@ def login_register_ui():
         email_reg = st.text_input("Email", key="register_email", placeholder="you@example.com")
         password_reg = st.text_input("Password", type="password", key="register_pass", placeholder="Choose a password")
         if st.button("Create account", key="register_btn"):
-            success = register_user(email_reg, password_reg, username_input)
+            with st.spinner("Creating account..."):
+                success = register_user(email_reg, password_reg, username_input)
             if success:
                 st.session_state.logged_in = True
                 st.session_state.username = username_input
@@ -139,45 +441,80 @@ def login_register_ui():
 if not st.session_state.logged_in:
     login_register_ui()
 
+# Not needed on the login page: starts the job workers and recovers old jobs
+from jobs import JOBS, DONE, FAILED
+from nlp import CHUNK_TOKENS, INCREMENTAL_CHUNK_TOKENS, regenerate_items
+
 with st.sidebar:
     st.image(SIDEBAR_USER_LOGO, width=100)
     st.markdown(f"## {st.session_state.username or 'User'}")
     st.markdown("---")
     st.markdown("### 📂 Previous Files")
 
-    user_files_dir = f"user_files/{st.session_state.username}"
-    os.makedirs(user_files_dir, exist_ok=True)
-    user_files = sorted(os.listdir(user_files_dir))
+    user_files = storage.scan_user_files(st.session_state.username)
 
     if not user_files:
         st.info("No Files Yet.")
     else:
-        for file in user_files:
-            file_path = os.path.join(user_files_dir, file)
-            with st.expander(f"📄 {file}", expanded=False):
+        query = st.text_input("Search files", key="files_query", placeholder="Search by name")
+        sort_by = st.selectbox("Sort by", ["Newest", "Name", "Largest"], key="files_sort")
+        matches = [f for f in user_files if query.lower() in f["name"].lower()]
+        if sort_by == "Newest":
+            matches = sorted(matches, key=lambda f: f["mtime"], reverse=True)
+        elif sort_by == "Largest":
+            matches = sorted(matches, key=lambda f: f["size"], reverse=True)
+
+        page_count = max(1, -(-len(matches) // FILES_PER_PAGE))
+        page = 1
+        if page_count > 1:
+            page = st.number_input(f"Page (of {page_count})", 1, page_count, key="files_page")
+        start = (page - 1) * FILES_PER_PAGE
+
+        for entry in matches[start:start + FILES_PER_PAGE]:
+            file = entry["name"]
+            with st.expander(f"📄 {file} · {format_size(entry['size'])}", expanded=False):
                 try:
                     if file.lower().endswith((".txt", ".md", ".py", ".csv")):
-                        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                            content = f.read()
+                        content = storage.read_head(entry["path"])
                         st.text_area("Preview", content, height=150, disabled=True)
                 except Exception:
                     st.warning("Could not load file content.")
 
-                with open(file_path, "rb") as f:
-                    st.download_button("⬇️ Download", f, file_name=file, key=f"download_{file}")
+                # File bytes are only read once a download is asked for
+                if st.session_state.get("download_ready") == file:
+                    st.download_button(
+                        "⬇️ Download",
+                        storage.read_user_file(st.session_state.username, file),
+                        file_name=file,
+                        key=f"download_{file}",
+                    )
+                elif st.button("⬇️ Prepare download", key=f"prepare_{file}"):
+                    st.session_state.download_ready = file
+                    st.rerun()
+
+                versions = storage.list_versions(st.session_state.username, filename=file)
+                if len(versions) > 1:
+                    version = st.selectbox(
+                        "Versions",
+                        versions,
+                        format_func=lambda v: time.strftime("%Y-%m-%d %H:%M", time.localtime(v["created"])),
+                        key=f"versions_{file}",
+                    )
+                    if st.button("Restore version", key=f"restore_{file}"):
+                        storage.restore_version(st.session_state.username, version["id"])
+                        st.success("Version restored!")
+                        st.rerun()
 
                 new_name = st.text_input("Rename file", value=file, key=f"rename_{file}")
                 if st.button("Save New Name", key=f"save_rename_{file}"):
-                    new_path = os.path.join(user_files_dir, new_name)
-                    if os.path.exists(new_path):
-                        st.warning("A file with that name already exists!")
-                    else:
-                        os.rename(file_path, new_path)
+                    if storage.rename_user_file(st.session_state.username, file, new_name):
                         st.success("Renamed!")
                         st.rerun()
+                    else:
+                        st.warning("A file with that name already exists!")
 
                 if st.button("Delete", key=f"delete_{file}"):
-                    os.remove(file_path)
+                    storage.delete_user_file(st.session_state.username, file)
                     st.success("File deleted!")
                     st.rerun()
 
@@ -195,11 +532,20 @@ st.markdown(
 
 uploaded_file = st.file_uploader("Upload PDF", type=["pdf"])
 pdf_text = None
+pdf_hash = None
 
 if uploaded_file:
-    with st.spinner("Extracting text from PDF..."):
-        pdf_text = extract_pdf_text(uploaded_file)
+    pdf_bytes = uploaded_file.getvalue()
+    pdf_hash = hash_bytes(pdf_bytes)
+    raw_text = extract_with_progress(pdf_bytes, pdf_hash)
     st.success("PDF extracted successfully!")
+    if raw_text:
+        # Every feature prompts with the same cleaned copy
+        pdf_text = cached_preprocess(raw_text)
+        saved = estimate_tokens(raw_text) - estimate_tokens(pdf_text)
+        if saved > 0:
+            st.caption(f"Removed ~{saved:,} tokens of headers, page numbers and other boilerplate before prompting.")
+        show_revision(uploaded_file.name, pdf_hash, pdf_text)
 
 if pdf_text:
     st.markdown("""
@@ -208,178 +554,27 @@ if pdf_text:
     </div>
     """, unsafe_allow_html=True)
 
-    # Summary Notes
-    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
-    st.markdown('<div class="section-card">', unsafe_allow_html=True)
-    cols = st.columns([8, 2])
-    with cols[0]:
-        st.subheader("📄 Summary Notes")
-    with cols[1]:
-        if not st.session_state.generated.get("notes"):
-            if st.button("Generate", key="gen_notes"):
-                with st.spinner("Generating summary notes..."):
-                    notes = summarize_text(pdf_text)
-                    st.session_state.generated["notes"] = notes
-                    try:
-                        save_user_file("notes.docx", export_docx(notes))
-                    except Exception:
-                        pass
-                    st.success("Notes generated.")
-                    st.rerun()
-        else:
-            if st.button("🔍 Preview", key="preview_notes_btn"):
-                show_preview_modal("📄 Summary Notes Preview", st.session_state.generated["notes"])
-    notes = st.session_state.generated.get("notes")
-    if notes:
-        for f in list_user_files():
-            if f.endswith("notes.docx"):
-                with open(f, "rb") as fh:
-                    st.download_button("Download DOCX", fh, file_name="notes.docx")
-                break
-    st.markdown('</div>', unsafe_allow_html=True)
-    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
-
-    # Presentation Slides
-    st.markdown('<div class="section-card">', unsafe_allow_html=True)
-    cols = st.columns([8, 2])
-    with cols[0]:
-        st.subheader("📅 Presentation Slides")
-    with cols[1]:
-        if not st.session_state.generated.get("ppt"):
-            if st.button("Generate", key="gen_ppt"):
-                with st.spinner("Generating PPT outline..."):
-                    ppt_text = create_ppt_outline(pdf_text)
-                    st.session_state.generated["ppt"] = ppt_text
-                    try:
-                        save_user_file("slides.pptx", export_ppt(ppt_text))
-                    except Exception:
-                        pass
-                    st.success("PPT outline generated.")
-                    st.rerun()
-        else:
-            if st.button("🔍 Preview", key="preview_ppt_btn"):
-                show_preview_modal("📅 PPT Outline Preview", st.session_state.generated["ppt"])
-    ppt_text = st.session_state.generated.get("ppt")
-    if ppt_text:
-        for f in list_user_files():
-            if f.endswith("slides.pptx"):
-                with open(f, "rb") as fh:
-                    st.download_button("Download PPTX", fh, file_name="slides.pptx")
-                break
-    st.markdown('</div>', unsafe_allow_html=True)
-    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
-
-    # Research Summary
-    st.markdown('<div class="section-card">', unsafe_allow_html=True)
-    cols = st.columns([8, 2])
-    with cols[0]:
-        st.subheader("📚 Research Summary")
-    with cols[1]:
-        if not st.session_state.generated.get("sections"):
-            if st.button("Generate", key="gen_sec"):
-                with st.spinner("Generating section summaries..."):
-                    sec_text = section_wise_summaries(pdf_text)
-                    st.session_state.generated["sections"] = sec_text
-                    try:
-                        save_user_file("section_summaries.pdf", export_pdf(sec_text))
-                    except Exception:
-                        pass
-                    st.success("Section summaries generated.")
-                    st.rerun()
-        else:
-            if st.button("🔍 Preview", key="preview_sections_btn"):
-                show_preview_modal("📚 Research Summary Preview", st.session_state.generated["sections"])
-    sec_text = st.session_state.generated.get("sections")
-    if sec_text:
-        for f in list_user_files():
-            if f.endswith("section_summaries.pdf"):
-                with open(f, "rb") as fh:
-                    st.download_button("Download PDF", fh, file_name="section_summaries.pdf")
-                break
-    st.markdown('</div>', unsafe_allow_html=True)
-    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+    # Results other users already generated for this document are reused
+    # unless the user asks for a fresh run
+    st.checkbox("🔄 Generate fresh instead of reusing shared results", key="force_fresh")
 
-    # Question Bank
-    st.markdown('<div class="section-card">', unsafe_allow_html=True)
-    cols = st.columns([8, 2])
-    with cols[0]:
-        st.subheader("🧾 Question Bank")
-        qtype = st.radio("Type", ["MCQs", "Written"], key="qtype_radio")
-        key_name = "questions_mcq" if qtype == "MCQs" else "questions_written"
-    with cols[1]:
-        if not st.session_state.generated.get(key_name):
-            if st.button("Generate", key="gen_questions"):
-                with st.spinner("Generating questions..."):
-                    if qtype == "MCQs":
-                        qtext = create_question_bank(pdf_text)
-                    else:
-                        qtext = create_written_answer_questions(pdf_text)
-                    st.session_state.generated[key_name] = qtext
-                    fname = "questions.docx" if qtype == "MCQs" else "written_answer_questions.docx"
-                    try:
-                        save_user_file(fname, export_docx(qtext))
-                        if qtype == "Written":
-                            save_user_file("written_answer_questions.pdf", export_pdf(qtext))
-                    except Exception:
-                        pass
-                    st.success("Questions generated.")
-                    st.rerun()
-        else:
-            if st.button("🔍 Preview", key="preview_questions_btn"):
-                show_preview_modal(f"🧾 {qtype} Preview", st.session_state.generated[key_name])
-    qtext = st.session_state.generated.get(key_name)
-    if qtext:
-        for f in list_user_files():
-            if qtype == "MCQs" and f.endswith("questions.docx"):
-                with open(f, "rb") as fh:
-                    st.download_button("Download MCQs (DOCX)", fh, file_name="questions.docx")
-                break
-            if qtype == "Written" and f.endswith("written_answer_questions.docx"):
-                with open(f, "rb") as fh:
-                    st.download_button("Download Written (DOCX)", fh, file_name="written_answer_questions.docx")
-                break
-        if qtype == "Written":
-            pdfs = [x for x in list_user_files() if x.endswith("written_answer_questions.pdf")]
-            if pdfs:
-                with open(pdfs[0], "rb") as pf:
-                    st.download_button("Download Written (PDF)", pf, file_name="written_answer_questions.pdf")
-    st.markdown('</div>', unsafe_allow_html=True)
-    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+    # Generate every missing artifact at once; the jobs run concurrently
+    missing = [
+        k for k in storage.EXPORTS
+        if (st.session_state.force_fresh or not st.session_state.generated.get(k))
+        and k not in st.session_state.jobs
+    ]
+    if missing and st.button("✨ Generate all", key="gen_all"):
+        for key in missing:
+            st.session_state.job_errors.pop(key, None)
+            st.session_state.jobs[key] = JOBS.submit(
+                st.session_state.username, key, pdf_text, source=pdf_hash, force=st.session_state.force_fresh,
+                incremental=is_incremental(),
+            )
+        st.rerun()
 
-    # Assignment Generator
-    st.markdown('<div class="section-card">', unsafe_allow_html=True)
-    cols = st.columns([8, 2])
-    with cols[0]:
-        st.subheader("📝 Assignment Generator")
-    with cols[1]:
-        if not st.session_state.generated.get("assignments"):
-            if st.button("Generate", key="gen_assignments"):
-                with st.spinner("Creating assignments..."):
-                    assignments = generate_group_assignments(pdf_text)
-                    st.session_state.generated["assignments"] = assignments
-                    try:
-                        save_user_file("assignments_all_groups.docx", export_docx(assignments))
-                        save_user_file("assignments_all_groups.pdf", export_pdf(assignments))
-                    except Exception:
-                        pass
-                    st.success("Assignments ready.")
-                    st.rerun()
-        else:
-            if st.button("🔍 Preview", key="preview_assignments_btn"):
-                show_preview_modal("📝 Assignment Generator Preview", st.session_state.generated["assignments"])
-    ass_text = st.session_state.generated.get("assignments")
-    if ass_text:
-        for f in list_user_files():
-            if f.endswith("assignments_all_groups.docx"):
-                with open(f, "rb") as fh:
-                    st.download_button("Download DOCX", fh, file_name="assignments_all_groups.docx")
-                break
-        pdfs = [x for x in list_user_files() if x.endswith("assignments_all_groups.pdf")]
-        if pdfs:
-            with open(pdfs[0], "rb") as pf:
-                st.download_button("Download PDF", pf, file_name="assignments_all_groups.pdf")
-    st.markdown("</div>", unsafe_allow_html=True)
-    st.markdown('<hr style="height:1px;border:none;color:#bbb;background-color:#bbb;" />', unsafe_allow_html=True)
+    # Only the sections rerun while jobs are polled, not the upload, clean-up and sidebar
+    st.fragment(run_every=1 if st.session_state.jobs else None)(job_sections)(pdf_text, pdf_hash)
 
     # MODAL POPUP (same as before)
     if st.session_state.get("show_modal") and st.session_state.get("modal_content"):
@@ -1,37 +1,67 @@
+import os
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 
-DB = "users.db"
+import metrics
+from db import DATABASE
+
+# bcrypt work factor for new hashes. Existing hashes at another cost are
+# rehashed the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.getenv("EDUSAGE_BCRYPT_ROUNDS", 12))
+BCRYPT_WORKERS = int(os.getenv("EDUSAGE_BCRYPT_WORKERS", os.cpu_count() or 1))
+
+# bcrypt releases the GIL, so a thread pool runs hashes in parallel while
+# capping how many compete for the CPU when a whole class logs in at once
+_hash_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="edusage-bcrypt")
 
 def init_db():
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT,
-        email TEXT UNIQUE,
-        password_hash BLOB
-    )
-    """)
-    conn.commit()
-    conn.close()
+    # Cheap on reruns: the schema is migrated once per process
+    DATABASE.migrate()
+
+# -------------------- PASSWORDS --------------------
+def _on_pool(stage, fn, *args):
+    # Timed including the wait for a free worker, which is what users feel
+    metrics.gauge_add("edusage_queue_depth", 1, queue="bcrypt")
+    try:
+        with metrics.timer(stage):
+            return _hash_pool.submit(fn, *args).result()
+    finally:
+        metrics.gauge_add("edusage_queue_depth", -1, queue="bcrypt")
+
+def hash_password(password, rounds=None):
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return _on_pool("bcrypt_hash", bcrypt.hashpw, password.encode(), salt)
+
+def check_password(password, stored_hash):
+    return _on_pool("bcrypt_check", bcrypt.checkpw, password.encode(), stored_hash)
+
+def hash_rounds(stored_hash):
+    # $2b$12$<salt+hash>
+    return int(stored_hash.split(b"$")[2])
+
+def _rehash(email, password, stored):
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
+    with DATABASE.connection() as conn:
+        # Only replace the hash we verified, in case the password changed meanwhile
+        conn.execute(
+            "UPDATE users SET password_hash=? WHERE email=? AND password_hash=?",
+            (hashed, email, stored)
+        )
 
 # -------------------- REGISTER --------------------
 def register_user(email, password, username):
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-
     # Hash password as bytes
-    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    hashed = hash_password(password)
 
     try:
         # Insert username, email, password_hash
-        c.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
-            (username, email, hashed)
-        )
-        conn.commit()
+        with DATABASE.connection() as conn:
+            conn.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+                (username, email, hashed)
+            )
         return True
     except sqlite3.IntegrityError:
         # Email already exists
@@ -39,31 +69,28 @@ def register_user(email, password, username):
     except Exception as e:
         print("Registration error:", e)
         return False
-    finally:
-        conn.close()
 
 # -------------------- LOGIN --------------------
 def validate_user(email, password):
     """
     Returns username if valid login, else False
     """
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("SELECT username, password_hash FROM users WHERE email=?", (email,))
-    row = c.fetchone()
-    conn.close()
+    with DATABASE.connection() as conn:
+        row = conn.execute("SELECT username, password_hash FROM users WHERE email=?", (email,)).fetchone()
 
     if not row:
         return False
 
-    username, stored_hash = row
+    username, stored = row
 
     # Ensure stored_hash is bytes
-    if isinstance(stored_hash, str):
-        stored_hash = stored_hash.encode()
+    stored_hash = stored.encode() if isinstance(stored, str) else stored
 
     # Check password
-    if bcrypt.checkpw(password.encode(), stored_hash):
+    if check_password(password, stored_hash):
+        if hash_rounds(stored_hash) != BCRYPT_ROUNDS:
+            # Upgrade in the background so this login isn't charged for it
+            _hash_pool.submit(_rehash, email, password, stored)
         return username  # Return username on successful login
     else:
         return False
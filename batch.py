@@ -0,0 +1,225 @@
+"""
+Headless batch mode: turns a folder or ZIP of PDFs into every artifact.
+
+    python batch.py semester/ out/
+    python batch.py semester.zip out/ --workers 4 --concurrency 8 --user hari
+
+Text extraction runs in a process pool and generation runs with bounded
+concurrency. out/manifest.json records every finished output, so an
+interrupted run picks up where it stopped when started again.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import metrics
+from cache import hash_bytes
+from nlp import FEATURES
+from preprocess import cached_preprocess
+from storage import EXPORTS, save_user_file
+from utils import MP_CONTEXT, cached_export, cached_extract_pdf_text
+
+MANIFEST = "manifest.json"
+
+
+def find_pdfs(source):
+    """
+    Returns {name: location} for every PDF in a directory tree or ZIP file.
+    A location is a file path or a (ZIP path, member) pair; see load_pdf.
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            names = [n for n in zf.namelist() if n.lower().endswith(".pdf") and not n.endswith("/")]
+        return {name: (source, name) for name in sorted(names)}
+
+    pdfs = {}
+    for root, _, files in os.walk(source):
+        for file in files:
+            if file.lower().endswith(".pdf"):
+                path = os.path.join(root, file)
+                pdfs[os.path.relpath(path, source)] = path
+    return dict(sorted(pdfs.items()))
+
+
+def load_pdf(location):
+    if isinstance(location, tuple):
+        archive, member = location
+        with zipfile.ZipFile(archive) as zf:
+            return zf.read(member)
+    with open(location, "rb") as f:
+        return f.read()
+
+
+def extract(location):
+    # Runs in a worker process, which reads the PDF itself so only one
+    # document per worker is in memory; the disk tier of EXTRACT_CACHE is shared
+    data = load_pdf(location)
+    return hash_bytes(data), cached_preprocess(cached_extract_pdf_text(data, workers=1))
+
+
+class Manifest:
+    """Outputs finished so far, saved atomically after every change."""
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, MANIFEST)
+        self._lock = threading.Lock()
+        self.data = {"documents": {}}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+
+    def document(self, name):
+        return self.data["documents"].get(name, {})
+
+    def done(self, name, digest, feature):
+        doc = self.document(name)
+        return doc.get("hash") == digest and feature in doc.get("outputs", {})
+
+    def record(self, name, digest, feature=None, files=None, error=None):
+        with self._lock:
+            doc = self.data["documents"].setdefault(name, {})
+            if doc.get("hash") != digest:
+                doc.clear()
+                doc.update({"hash": digest, "outputs": {}, "errors": {}})
+            if feature and files is not None:
+                doc["outputs"][feature] = files
+                doc["errors"].pop(feature, None)
+            if feature and error is not None:
+                doc["errors"][feature] = error
+            self._save()
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def output_dir(out_dir, name):
+    stem = os.path.splitext(name)[0].replace("/", "__").replace("\\", "__")
+    return os.path.join(out_dir, stem)
+
+
+def generate(name, digest, feature, text, out_dir, use_cache, user):
+    result = FEATURES[feature](text, use_cache=use_cache)
+    directory = output_dir(out_dir, name)
+    os.makedirs(directory, exist_ok=True)
+
+    files = []
+    for filename, fmt in EXPORTS[feature]:
+        data = cached_export(fmt, result, feature)
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as f:
+            f.write(data)
+        files.append(os.path.relpath(path, out_dir))
+        if user:
+            stem = os.path.splitext(os.path.basename(name))[0]
+            save_user_file(user, f"{stem}_{filename}", data, digest)
+    return files
+
+
+def run(source, out_dir, features, workers, concurrency, use_cache=True, user=None):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(out_dir)
+    pdfs = find_pdfs(source)
+
+    started = time.monotonic()
+    stats = {"documents": 0, "characters": 0, "generated": 0, "skipped": 0, "failed": 0}
+    total = len(pdfs) * len(features)
+    lock = threading.Lock()
+
+    def report(outcome, message):
+        with lock:
+            stats[outcome] += 1
+            finished = stats["generated"] + stats["skipped"] + stats["failed"]
+            elapsed = time.monotonic() - started
+            rate = stats["generated"] / elapsed * 60 if elapsed else 0.0
+        print(f"[{finished}/{total}] {message}  ({rate:.1f} outputs/min)", file=sys.stderr, flush=True)
+
+    def task(name, digest, feature, text):
+        # Record each output as soon as it exists so an interrupted run resumes here
+        try:
+            files = generate(name, digest, feature, text, out_dir, use_cache, user)
+        except Exception as e:
+            manifest.record(name, digest, feature, error=str(e))
+            report("failed", f"FAILED  {feature}  {name}: {e}")
+            return
+        manifest.record(name, digest, feature, files=files)
+        report("generated", f"done  {feature}  {name}")
+
+    extract_pool = ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT)
+    llm_pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        extractions = {extract_pool.submit(extract, location): name for name, location in pdfs.items()}
+        for future in as_completed(extractions):
+            name = extractions[future]
+            try:
+                digest, text = future.result()
+            except Exception as e:
+                for feature in features:
+                    report("failed", f"extraction failed  {feature}  {name}: {e}")
+                continue
+
+            stats["documents"] += 1
+            stats["characters"] += len(text)
+            manifest.record(name, digest)
+            for feature in features:
+                if manifest.done(name, digest, feature):
+                    report("skipped", f"already done  {feature}  {name}")
+                else:
+                    llm_pool.submit(task, name, digest, feature, text)
+        llm_pool.shutdown(wait=True)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to resume.", file=sys.stderr)
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+        extract_pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    extract_pool.shutdown()
+
+    elapsed = time.monotonic() - started
+    print(
+        f"\n{stats['documents']} documents ({stats['characters']:,} characters), "
+        f"{stats['generated']} generated, {stats['skipped']} already done, {stats['failed']} failed "
+        f"in {elapsed:.1f}s ({stats['generated'] / elapsed * 60 if elapsed else 0:.1f} outputs/min). "
+        f"Manifest: {manifest.path}",
+        file=sys.stderr,
+    )
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="folder or .zip of PDFs")
+    parser.add_argument("out_dir", help="where outputs and manifest.json are written")
+    parser.add_argument("--features", nargs="+", choices=list(FEATURES), default=list(FEATURES),
+                        help="artifacts to generate (default: all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="extraction processes (default: CPU count)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="features generated at the same time (default 4)")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the LLM response cache")
+    parser.add_argument("--user", help="also save the outputs to this user's files")
+    args = parser.parse_args(argv)
+
+    metrics.start_exporters()
+    stats = run(
+        args.source,
+        args.out_dir,
+        args.features,
+        args.workers,
+        args.concurrency,
+        use_cache=not args.no_cache,
+        user=args.user,
+    )
+    if metrics.METRICS_FILE:
+        metrics.write()
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Benchmarks registration and login latency under concurrent sessions.
+
+    python -m benchmarks.bench_auth --sessions 100
+    python -m benchmarks.bench_auth --save-baseline auth.json
+
+Each session registers one account and then logs in --logins times, all
+sessions at once. The old connect-per-call code (rollback journal, default
+5 s lock timeout) runs first as the "before" numbers, then auth.py on the
+pooled WAL database. bcrypt runs at --rounds (default 4) so that the
+database, not hashing, is what gets measured.
+"""
+import argparse
+import functools
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import auth
+import db
+from benchmarks import common
+
+
+def legacy_init(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        email TEXT UNIQUE,
+        password_hash BLOB
+    )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def legacy_register(path, rounds, email, password, username):
+    """The previous register_user: a fresh connection, init on every call."""
+    legacy_init(path)
+    conn = sqlite3.connect(path)
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds))
+    try:
+        conn.execute(
+            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+            (username, email, hashed),
+        )
+        conn.commit()
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+
+def legacy_validate(path, email, password):
+    legacy_init(path)
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute("SELECT username, password_hash FROM users WHERE email=?", (email,)).fetchone()
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+    return bool(row) and bcrypt.checkpw(password.encode(), row[1]) and row[0]
+
+
+def run_sessions(sessions, logins, register, validate):
+    """Returns (register latencies, login latencies, failed calls, wall seconds)."""
+    registers, validations = [], []
+    failures = 0
+    lock = threading.Lock()
+    start = threading.Barrier(sessions)
+
+    def session(number):
+        nonlocal failures
+        email = f"student{number}@example.edu"
+        start.wait()
+
+        began = time.perf_counter()
+        ok = register(email, "correct horse", f"student{number}")
+        elapsed = time.perf_counter() - began
+        with lock:
+            registers.append(elapsed)
+            failures += not ok
+
+        for _ in range(logins):
+            began = time.perf_counter()
+            ok = validate(email, "correct horse")
+            elapsed = time.perf_counter() - began
+            with lock:
+                validations.append(elapsed)
+                failures += not ok
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    return registers, validations, failures, time.perf_counter() - began
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100, help="concurrent sessions (default 100)")
+    parser.add_argument("--logins", type=int, default=5, help="logins per session (default 5)")
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt cost factor (default 4)")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    auth.BCRYPT_ROUNDS = args.rounds
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "legacy.db")
+        registers, validations, failures, wall = run_sessions(
+            args.sessions,
+            args.logins,
+            functools.partial(legacy_register, path, args.rounds),
+            functools.partial(legacy_validate, path),
+        )
+        rows.append(common.summarize(f"per-call register[{args.sessions}]", registers))
+        rows.append(common.summarize(f"per-call login[{args.sessions}]", validations))
+        print(f"per-call connections: {len(registers) + len(validations)} calls in {wall:.2f}s, {failures} failed")
+
+        auth.DATABASE = db.Database(os.path.join(tmp, "pooled.db"))
+        registers, validations, failures, wall = run_sessions(
+            args.sessions, args.logins, auth.register_user, auth.validate_user
+        )
+        rows.append(common.summarize(f"pooled register[{args.sessions}]", registers))
+        rows.append(common.summarize(f"pooled login[{args.sessions}]", validations))
+        print(f"pooled WAL connections: {len(registers) + len(validations)} calls in {wall:.2f}s, {failures} failed\n")
+        auth.DATABASE.close()
+
+    return common.finish(args, rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
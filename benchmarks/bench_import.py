@@ -0,0 +1,116 @@
+"""
+Benchmarks cold start: a fresh interpreter up to the login page, and up to
+the first finished generation.
+
+    python -m benchmarks.bench_import --repeat 5
+    python -m benchmarks.bench_import --save-baseline import.json
+
+Every run starts a new Python process, as a new pod would, and the peak RSS
+is the largest any of them reached. The login-page
+run is also traced with -X importtime, and its slowest imports are listed.
+The generation run uses the fake Gemini backend, but still imports and
+configures the real SDK, as the first real call does.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import common
+from benchmarks.bench_pipeline import synthetic_pdf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What app.py runs before it can draw the login page
+LOGIN_PAGE = """
+import streamlit, auth, cache, metrics, storage, utils
+auth.init_db()
+"""
+
+FIRST_GENERATION = LOGIN_PAGE + """
+import llm, nlp, sys, utils
+from jobs import JOBS
+from benchmarks.fake_gemini import factory
+llm.genai()
+llm.client = llm.GeminiClient(model_factory=factory(0.0, 2000))
+text = utils.extract_pdf_text(sys.argv[1], workers=1)
+utils.export_docx(nlp.summarize_text(text, use_cache=False))
+"""
+
+# The child reports its own peak: ru_maxrss would carry over the parent's from before exec
+REPORT_PEAK_RSS = """
+from benchmarks import common
+print(common.peak_rss_mb())
+"""
+
+
+def run(code, env, *args, importtime=False):
+    """Runs code in a fresh interpreter; returns (seconds, stderr, peak RSS in MB)."""
+    command = [sys.executable, "-W", "ignore"]
+    if importtime:
+        command += ["-X", "importtime"]
+    start = time.perf_counter()
+    done = subprocess.run(command + ["-c", code + REPORT_PEAK_RSS, *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if done.returncode:
+        raise RuntimeError(done.stderr)
+    peak = done.stdout.splitlines()[-1]
+    return elapsed, done.stderr, None if peak == "None" else float(peak)
+
+
+def slowest_imports(trace, top):
+    """(cumulative seconds, module) for the slowest top-level imports in an -X importtime trace."""
+    rows = []
+    for line in trace.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per stage (default 5)")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list (default 10)")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            EDUSAGE_CACHE_DIR=os.path.join(tmp, "cache"),
+            EDUSAGE_DB=os.path.join(tmp, "users.db"),
+            EDUSAGE_JOBS_DB=os.path.join(tmp, "jobs.db"),
+            EDUSAGE_RESPONSE_CACHE_DB=os.path.join(tmp, "responses.db"),
+        )
+        pdf = os.path.join(tmp, "lecture.pdf")
+        with open(pdf, "wb") as f:
+            f.write(synthetic_pdf(5))
+
+        for name, code, extra in (
+            ("interpreter startup", "pass", ()),
+            ("time to login page", LOGIN_PAGE, ()),
+            ("time to first generation", FIRST_GENERATION, (pdf,)),
+        ):
+            runs = [run(code, env, *extra) for _ in range(args.repeat)]
+            latencies = [seconds for seconds, _, _ in runs]
+            peaks = [peak for _, _, peak in runs if peak is not None]
+            rows.append(common.summarize(name, latencies, peak_rss=max(peaks, default=None)))
+
+        _, trace, _ = run(LOGIN_PAGE, env, importtime=True)
+
+    print("Slowest imports on the way to the login page:")
+    for seconds, module in slowest_imports(trace, args.top):
+        print(f"  {seconds:8.3f}s  {module}")
+    print()
+    return common.finish(args, rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Sweeps the bcrypt cost factor under a burst of concurrent logins.
+
+    python -m benchmarks.bench_login --rounds 10 11 12 13 --sessions 50
+    python -m benchmarks.bench_login --target-p99 1.0 --save-baseline login.json
+
+For each cost, --sessions logins arrive at once (the start of a lecture)
+and go through auth.validate_user on a scratch database. The report ends
+with the highest cost whose p99 login latency stays under --target-p99;
+set EDUSAGE_BCRYPT_ROUNDS to that value.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import auth
+import db
+from benchmarks import common
+
+PASSWORD = "correct horse battery staple"
+
+
+def login_burst(sessions, accounts):
+    """Returns (per-login latencies, wall seconds, failed logins)."""
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+    start = threading.Barrier(sessions)
+
+    def login(number):
+        nonlocal failures
+        start.wait()
+        began = time.perf_counter()
+        ok = auth.validate_user(accounts[number % len(accounts)], PASSWORD)
+        elapsed = time.perf_counter() - began
+        with lock:
+            latencies.append(elapsed)
+            failures += not ok
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(login, range(sessions)))
+    return latencies, time.perf_counter() - began, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13],
+                        help="bcrypt costs to try (default: 10 11 12 13)")
+    parser.add_argument("--sessions", type=int, default=50, help="logins per burst (default 50)")
+    parser.add_argument("--accounts", type=int, default=10, help="distinct accounts (default 10)")
+    parser.add_argument("--target-p99", type=float, default=1.0, help="p99 login latency goal in seconds")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    print(f"bcrypt pool: {auth.BCRYPT_WORKERS} workers\n")
+    rows = []
+    best = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for rounds in args.rounds:
+            auth.BCRYPT_ROUNDS = rounds
+            auth.DATABASE = db.Database(os.path.join(tmp, f"users-{rounds}.db"))
+            accounts = [f"student{n}@example.edu" for n in range(args.accounts)]
+            for email in accounts:
+                auth.register_user(email, PASSWORD, email.split("@")[0])
+
+            latencies, wall, failures = login_burst(args.sessions, accounts)
+            row = common.summarize(f"login[cost {rounds}, {args.sessions} at once]", latencies)
+            row["throughput"] = args.sessions / wall
+            row["unit"] = "logins/s"
+            rows.append(row)
+            if failures:
+                print(f"cost {rounds}: {failures} failed logins")
+            if row["p99"] <= args.target_p99:
+                best = max(best or 0, rounds)
+            auth.DATABASE.close()
+
+    code = common.finish(args, rows)
+    if best is None:
+        print(f"\nNo cost kept p99 under {args.target_p99:.2f}s; add bcrypt workers or lower the cost.")
+    else:
+        print(f"\nHighest cost with p99 under {args.target_p99:.2f}s: {best} (EDUSAGE_BCRYPT_ROUNDS={best})")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
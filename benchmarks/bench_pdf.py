@@ -0,0 +1,97 @@
+"""
+Benchmarks utils.export_pdf on long generated documents.
+
+    python -m benchmarks.bench_pdf --lines 10000 50000
+    python -m benchmarks.bench_pdf --save-baseline pdf.json
+
+Each size is rendered into memory and streamed to a file sink; the old
+fixed-width drawString renderer is included as a reference point.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+import utils
+from benchmarks import common
+from benchmarks.fake_gemini import WORDS
+
+
+def question_bank(lines, seed=0):
+    """LLM-style output: headings, numbered questions, options and paragraphs."""
+    rng = random.Random(seed)
+    out = []
+    number = 0
+    while len(out) < lines:
+        if number % 25 == 0:
+            out += ["", f"## Section {number // 25 + 1}", ""]
+        number += 1
+        out.append(f"{number}. " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))) + "?")
+        for option in "ABCD":
+            out.append(f"- {option}) " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))))
+        out.append("Answer: " + rng.choice("ABCD"))
+    return "\n".join(out[:lines])
+
+
+def legacy_export_pdf(content):
+    """The previous renderer: 90-character wrap, one drawString per line."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    y = height - 50
+    for line in content.split("\n"):
+        while len(line) > 90:
+            c.drawString(50, y, line[:90])
+            line = line[90:]
+            y -= 15
+            if y < 50:
+                c.showPage()
+                y = height - 50
+        c.drawString(50, y, line)
+        y -= 15
+        if y < 50:
+            c.showPage()
+            y = height - 50
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[10_000, 50_000],
+                        help="document sizes in lines (default: 10000 50000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (default 3)")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for lines in args.lines:
+        text = question_bank(lines)
+
+        latencies, _ = common.measure(lambda: legacy_export_pdf(text), args.repeat)
+        rows.append(common.summarize(f"legacy drawString[{lines} lines]", latencies, lines, "lines"))
+
+        latencies, _ = common.measure(lambda: utils.export_pdf(text), args.repeat)
+        rows.append(common.summarize(f"export_pdf[{lines} lines]", latencies, lines, "lines"))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.pdf")
+
+            def to_file():
+                with open(path, "wb") as sink:
+                    utils.export_pdf(iter(text.split("\n")), sink=sink)
+
+            latencies, _ = common.measure(to_file, args.repeat)
+            rows.append(common.summarize(f"export_pdf sink[{lines} lines]", latencies, lines, "lines"))
+
+    return common.finish(args, rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Benchmarks the extraction -> generation -> export pipeline offline.
+
+    python -m benchmarks.bench_pipeline --pages 1 10 100 1000 --repeat 3
+    python -m benchmarks.bench_pipeline --save-baseline baseline.json
+    python -m benchmarks.bench_pipeline --compare baseline.json
+
+Generation runs against benchmarks.fake_gemini, so no API key is needed;
+--latency and --output-chars shape the fake model's replies.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+import llm
+import nlp
+import retrieval
+import utils
+from benchmarks import common
+from benchmarks.fake_gemini import WORDS, factory
+
+
+def synthetic_pdf(pages, lines_per_page=45, seed=0):
+    """Builds a text PDF with a running header, body lines and a page number."""
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    for number in range(1, pages + 1):
+        c.drawString(50, height - 30, "Introduction to Benchmarking - Lecture Notes")
+        y = height - 60
+        for _ in range(lines_per_page):
+            c.drawString(50, y, " ".join(rng.choice(WORDS) for _ in range(12)))
+            y -= 15
+        c.drawString(width / 2, 25, str(number))
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def bench_extraction(sizes, repeat, workers):
+    # Calls can't use more than the process-wide EXTRACT_WORKERS
+    workers = min(workers, utils.EXTRACT_WORKERS)
+    rows = []
+    texts = {}
+    for pages in sizes:
+        data = synthetic_pdf(pages)
+        latencies, texts[pages] = common.measure(lambda: utils.extract_pdf_text(data, workers=1), repeat)
+        rows.append(common.summarize(f"extract[{pages}p, 1 worker]", latencies, pages, "pages"))
+        if workers > 1 and pages >= utils.PARALLEL_MIN_PAGES:
+            latencies, _ = common.measure(lambda: utils.extract_pdf_text(data, workers=workers), repeat)
+            rows.append(common.summarize(f"extract[{pages}p, {workers} workers]", latencies, pages, "pages"))
+    return rows, texts
+
+
+def bench_retrieval(text, repeat):
+    """Index build, reload from disk and focused prompt assembly."""
+    rows = []
+    pages = text.count("\n\n") + 1
+    latencies, index = common.measure(lambda: retrieval.Index.build(text), repeat)
+    rows.append(common.summarize(f"retrieval.build[{pages}p]", latencies, pages, "pages"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index")
+        index.save(path)
+        latencies, _ = common.measure(lambda: retrieval.Index.load(path), repeat)
+    rows.append(common.summarize(f"retrieval.load[{pages}p]", latencies, pages, "pages"))
+
+    latencies, focused = common.measure(lambda: index.select(nlp.SECTION_QUERIES), repeat)
+    rows.append(common.summarize("retrieval.select[sections]", latencies))
+    print(
+        f"sections prompt: {nlp.estimate_tokens(text):,} -> {nlp.estimate_tokens(focused):,} "
+        f"document tokens with retrieval"
+    )
+    return rows
+
+
+def bench_generation(text, repeat):
+    rows = []
+    outputs = {}
+    for key, feature in nlp.FEATURES.items():
+        latencies, outputs[key] = common.measure(lambda: feature(text, use_cache=False), repeat)
+        rows.append(common.summarize(f"nlp.{feature.__name__}", latencies))
+
+    def run_all():
+        return list(nlp.generate_all(text, use_cache=False))
+
+    latencies, _ = common.measure(run_all, repeat)
+    rows.append(common.summarize("nlp.generate_all", latencies, len(nlp.FEATURES), "features"))
+    return rows, outputs
+
+
+def bench_exports(outputs, repeat):
+    rows = []
+    text = "\n".join(outputs.values())
+    lines = text.count("\n") + 1
+    for exporter in (utils.export_docx, utils.export_pdf):
+        latencies, _ = common.measure(lambda: exporter(text), repeat)
+        rows.append(common.summarize(f"utils.{exporter.__name__}", latencies, lines, "lines"))
+
+    latencies, _ = common.measure(lambda: utils.export_ppt(outputs["ppt"]), repeat)
+    rows.append(common.summarize("utils.export_ppt", latencies))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="synthetic PDF sizes to extract (default: 1 10 100 1000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (default 3)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="process-pool size for parallel extraction (at most EDUSAGE_EXTRACT_WORKERS)")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model latency in seconds")
+    parser.add_argument("--output-chars", type=int, default=4000, help="fake model reply size")
+    parser.add_argument("--generation-pages", type=int, default=None,
+                        help="which extracted document to generate from (default: the largest)")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    llm.client = llm.GeminiClient(
+        requests_per_minute=1_000_000,
+        burst=1_000,
+        model_factory=factory(args.latency, args.output_chars),
+    )
+
+    with common.temporary_caches():
+        rows, texts = bench_extraction(args.pages, args.repeat, args.workers)
+        text = texts[args.generation_pages or max(args.pages)]
+        rows += bench_retrieval(text, args.repeat)
+        generation_rows, outputs = bench_generation(text, args.repeat)
+        rows += generation_rows
+        rows += bench_exports(outputs, args.repeat)
+    return common.finish(args, rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Benchmarks preprocess.preprocess: how many prompt tokens it removes and how
+fast it runs.
+
+    python -m benchmarks.bench_preprocess --pages 50 300
+    python -m benchmarks.bench_preprocess --pdf lecture.pdf slides.pdf
+    python -m benchmarks.bench_preprocess --drop-references
+    python -m benchmarks.bench_preprocess --save-baseline preprocess.json
+
+Without --pdf the input is generated lecture text with a running header, a
+page footer, hard-wrapped and hyphenated lines and a reference list at the
+end, shaped like pdfplumber output.
+"""
+import argparse
+import os
+import random
+import sys
+
+import preprocess
+import utils
+from benchmarks import common
+from benchmarks.fake_gemini import WORDS
+
+
+def lecture_text(pages, lines_per_page=40, width=80, seed=0):
+    """Extracted-text stand-in: pages separated by blank lines, as utils.extract_pdf_text returns."""
+    rng = random.Random(seed)
+    reference_pages = max(1, pages // 10)
+    out = []
+    for number in range(1, pages + 1):
+        lines = [f"CS 204 Data Structures - Week {1 + number // 12}"]
+        if number > pages - reference_pages:
+            if number == pages - reference_pages + 1:
+                lines.append("References")
+            for n in range(lines_per_page // 2):
+                authors = ", ".join(rng.choice(WORDS).title() for _ in range(3))
+                lines.append(f"[{n + 1}] {authors}. {' '.join(rng.choice(WORDS) for _ in range(8))}. {rng.randint(1990, 2024)}.")
+        else:
+            line = ""
+            while len(lines) < lines_per_page:
+                word = rng.choice(WORDS) + ("." if rng.random() < 0.08 else "")
+                if len(line) + len(word) + 1 > width:
+                    # Break some long words across lines the way typeset text does
+                    if len(word) > 6 and rng.random() < 0.3:
+                        lines.append(f"{line} {word[:3]}-".strip())
+                        line = word[3:]
+                    else:
+                        lines.append(line)
+                        line = word
+                else:
+                    line = f"{line} {word}".strip()
+        lines.append(f"Page {number} of {pages}")
+        out.append("\n".join(lines))
+    return "\n\n".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 300],
+                        help="generated document sizes in pages (default: 50 300)")
+    parser.add_argument("--pdf", nargs="+", default=[], help="real PDFs to measure instead")
+    parser.add_argument("--drop-references", action="store_true", help="also drop reference lists")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per document (default 5)")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.pdf:
+        documents = [(os.path.basename(path), utils.extract_pdf_text(path, workers=1)) for path in args.pdf]
+    else:
+        documents = [(f"{pages}p", lecture_text(pages)) for pages in args.pages]
+
+    rows = []
+    print(f"{'document':<24}{'tokens before':>15}{'tokens after':>15}{'saved':>10}")
+    for name, text in documents:
+        pages = text.count("\n\n") + 1
+        latencies, (_, stats) = common.measure(
+            lambda: preprocess.preprocess(text, drop_references=args.drop_references), args.repeat
+        )
+        row = common.summarize(f"preprocess[{name}]", latencies, pages, "pages")
+        row["reduction"] = stats["tokens_saved"] / max(stats["tokens_before"], 1)
+        rows.append(row)
+        print(f"{name:<24}{stats['tokens_before']:>15,}{stats['tokens_after']:>15,}{row['reduction']:>10.1%}")
+    print()
+    return common.finish(args, rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
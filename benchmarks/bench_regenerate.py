@@ -0,0 +1,89 @@
+"""
+Benchmarks partial regeneration of structured results (MCQs, written
+questions, slides) against generating the whole result again.
+
+    python -m benchmarks.bench_regenerate --pages 20 100 --items 1 3
+    python -m benchmarks.bench_regenerate --save-baseline regenerate.json
+
+Uses the fake Gemini backend with no latency, so the timings are EduSage's
+own overhead; the token counts are what a real run would send and get back.
+"""
+import argparse
+import json
+import sys
+
+import llm
+import nlp
+import structured
+from benchmarks import common
+from benchmarks.bench_preprocess import lecture_text
+from benchmarks.fake_gemini import FakeGeminiModel
+
+FEATURES = ("questions_mcq", "questions_written", "ppt")
+
+
+class CountingModel(FakeGeminiModel):
+    """Fake model that records the size of every prompt it is sent."""
+
+    prompt_chars = []
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        self.prompt_chars.append(len(prompt))
+        return await super().generate_content_async(prompt, stream, **kwargs)
+
+
+def tokens(chars):
+    return chars // nlp.CHARS_PER_TOKEN
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 100],
+                        help="document sizes in pages (default: 20 100)")
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 3],
+                        help="items regenerated at a time (default: 1 3)")
+    parser.add_argument("--output-chars", type=int, default=6000,
+                        help="size of a full fake reply (default 6000, about 25 MCQs)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (default 3)")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    llm.client = llm.GeminiClient(
+        requests_per_minute=1_000_000, burst=1000,
+        model_factory=lambda name: CountingModel(name, latency=0.0, output_chars=args.output_chars),
+    )
+
+    rows = []
+    print(f"{'run':<40}{'prompt tokens':>15}{'reply tokens':>14}{'share':>8}")
+    with common.temporary_caches():
+        for pages in args.pages:
+            text = lecture_text(pages)
+            for feature in FEATURES:
+                CountingModel.prompt_chars.clear()
+                latencies, result = common.measure(
+                    lambda: nlp.FEATURES[feature](text, use_cache=False), args.repeat
+                )
+                full_prompt = sum(CountingModel.prompt_chars) // args.repeat
+                full_cost = full_prompt + len(result)
+                rows.append(common.summarize(f"full {feature}[{pages}p]", latencies))
+                print(f"{f'full {feature}[{pages}p]':<40}{tokens(full_prompt):>15,}{tokens(len(result)):>14,}{1:>8.0%}")
+
+                model = structured.load(feature, result)
+                for count in args.items:
+                    picked = list(range(min(count, len(structured.items(model)))))
+                    CountingModel.prompt_chars.clear()
+                    latencies, updated = common.measure(
+                        lambda: nlp.regenerate_items(feature, text, model, picked), args.repeat
+                    )
+                    prompt = sum(CountingModel.prompt_chars) // args.repeat
+                    # What the reply has to carry: the new items
+                    reply = len(json.dumps([structured.items(updated)[i] for i in picked]))
+                    name = f"regenerate {count} {feature}[{pages}p]"
+                    rows.append(common.summarize(name, latencies))
+                    print(f"{name:<40}{tokens(prompt):>15,}{tokens(reply):>14,}{(prompt + reply) / full_cost:>8.1%}")
+    print()
+    return common.finish(args, rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
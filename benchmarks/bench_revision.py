@@ -0,0 +1,95 @@
+"""
+Benchmarks regenerating a revised document: v1 is generated, a few pages
+are edited and one is inserted, and v2 is generated again with the
+response cache from v1, the way the app does: v1 as a first upload and v2
+chunked only when v1 was (see revisions.record).
+
+    python -m benchmarks.bench_revision --pages 200 --edits 3
+    python -m benchmarks.bench_revision --save-baseline revision.json
+
+Reports the model calls and prompt tokens v2 needs compared with a cold
+run of v2 as a first upload, with content-defined chunk boundaries and with
+them switched off (plain size-based chunks, where the inserted page shifts
+every later one). Documents under nlp.CHUNK_TOKENS (about 130 generated
+pages) go out as one prompt both times and reuse nothing.
+"""
+import argparse
+import os
+import random
+import sys
+
+import llm
+import nlp
+import revisions
+from benchmarks import common
+from benchmarks.bench_preprocess import lecture_text
+from benchmarks.bench_regenerate import CountingModel
+from cache import ResponseCache
+from preprocess import preprocess
+
+FEATURES = ("notes", "questions_mcq", "questions_written", "ppt")
+
+
+def revise(text, edits, seed=0):
+    """Rewrites one line on `edits` pages spread over the document and inserts a new page in the middle."""
+    rng = random.Random(seed)
+    pages = text.split("\n\n")
+    # Away from the reference list at the end, which preprocessing may drop
+    for number in sorted(rng.sample(range(1, len(pages) * 8 // 10), edits)):
+        lines = pages[number].split("\n")
+        lines[len(lines) // 2] = "This paragraph was rewritten for the second revision of the lecture."
+        pages[number] = "\n".join(lines)
+    middle = len(pages) // 2
+    pages.insert(middle, lecture_text(10, seed=seed + 1).split("\n\n")[0])
+    return "\n\n".join(pages)
+
+
+def run(feature, text, use_cache, incremental=False):
+    """Model calls and prompt tokens one generation sends."""
+    CountingModel.prompt_chars.clear()
+    nlp.FEATURES[feature](text, use_cache=use_cache, incremental=incremental)
+    return len(CountingModel.prompt_chars), sum(CountingModel.prompt_chars) // nlp.CHARS_PER_TOKEN
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="document size in pages (default 200)")
+    parser.add_argument("--edits", type=int, default=3, help="pages edited in v2 (default 3)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (default 3)")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    llm.client = llm.GeminiClient(
+        requests_per_minute=1_000_000, burst=1000,
+        model_factory=lambda name: CountingModel(name, latency=0.0, output_chars=4000),
+    )
+    v1, _ = preprocess(lecture_text(args.pages))
+    v2, _ = preprocess(revise(lecture_text(args.pages), args.edits))
+    changed = revisions.changed_pages(revisions.page_hashes(v1), revisions.page_hashes(v2))
+    # What revisions.record reports for v2, whose parent v1 was a first upload
+    incremental = nlp.estimate_tokens(v1) > nlp.CHUNK_TOKENS
+    print(f"v2 changes {len(changed)} of {v2.count(chr(10) * 2) + 1} pages: {changed}")
+    print(f"v1 is {nlp.estimate_tokens(v1):,} tokens; v2 is {'chunked' if incremental else 'one prompt'}\n")
+
+    rows = []
+    print(f"{'run':<44}{'calls':>8}{'prompt tokens':>16}{'share':>8}")
+    with common.temporary_caches() as tmp:
+        for label, odds in (("content-defined", nlp.BOUNDARY_ODDS), ("size-based", 1 << 62)):
+            nlp.BOUNDARY_ODDS = odds
+            for feature in FEATURES:
+                nlp.RESPONSE_CACHE = ResponseCache(os.path.join(tmp, f"{label}-{feature}.db"))
+                run(feature, v1, use_cache=True)
+                calls, tokens = run(feature, v2, use_cache=True, incremental=incremental)
+                cold_calls, cold_tokens = run(feature, v2, use_cache=False)
+                name = f"v2 {feature} [{label}]"
+                print(f"{name:<44}{calls:>4} / {cold_calls:<3}{tokens:>9,} / {cold_tokens:<8,}{tokens / cold_tokens:>6.0%}")
+
+                # Timing with the v1 responses cached, as a revision upload sees it
+                latencies, _ = common.measure(lambda: nlp.FEATURES[feature](v2, use_cache=True, incremental=incremental), args.repeat)
+                rows.append(common.summarize(name, latencies))
+    print()
+    return common.finish(args, rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
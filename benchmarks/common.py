@@ -0,0 +1,163 @@
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process since the last reset_peak_rss(),
+    or None where the kernel can't reset it (anywhere but Linux). Child
+    processes, such as extraction workers, are not included.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Restarts peak_rss_mb() from the current RSS; returns False where that isn't supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# Whether peak_rss_mb() can be scoped to one stage
+PER_STAGE_RSS = os.access("/proc/self/clear_refs", os.W_OK)
+
+
+@contextlib.contextmanager
+def temporary_caches():
+    """
+    Points the response cache and the caches under CACHE_DIR at a temporary
+    directory, so fake replies and benchmark documents stay out of the app's.
+    Yields the directory.
+    """
+    import nlp
+    import preprocess
+    import retrieval
+    import utils
+    from cache import ResponseCache
+
+    saved = (nlp.RESPONSE_CACHE, retrieval.INDEX_DIR, utils.EXTRACT_CACHE.dir, preprocess.CLEAN_CACHE.dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        nlp.RESPONSE_CACHE = ResponseCache(os.path.join(tmp, "response_cache.db"))
+        retrieval.INDEX_DIR = os.path.join(tmp, "retrieval")
+        utils.EXTRACT_CACHE.dir = os.path.join(tmp, utils.EXTRACT_CACHE.name)
+        preprocess.CLEAN_CACHE.dir = os.path.join(tmp, preprocess.CLEAN_CACHE.name)
+        try:
+            yield tmp
+        finally:
+            nlp.RESPONSE_CACHE, retrieval.INDEX_DIR, utils.EXTRACT_CACHE.dir, preprocess.CLEAN_CACHE.dir = saved
+
+
+def measure(fn, repeat):
+    """Runs fn `repeat` times and returns (latencies in seconds, last result)."""
+    reset_peak_rss()  # so setup before the stage doesn't count towards its peak
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies, result
+
+
+def summarize(name, latencies, units=None, unit_name="items", peak_rss=None):
+    """
+    Builds one report row; `units` is the work done per run, for throughput.
+    The peak RSS is this process's since measure() or the previous row,
+    unless `peak_rss` gives it (e.g. for stages run in a subprocess).
+    """
+    if peak_rss is None and PER_STAGE_RSS:
+        peak_rss = peak_rss_mb()
+    reset_peak_rss()
+    p50 = percentile(latencies, 50)
+    row = {
+        "stage": name,
+        "runs": len(latencies),
+        "p50": p50,
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "peak_rss_mb": None if peak_rss is None else round(peak_rss, 1),
+    }
+    if units:
+        row["throughput"] = units / p50 if p50 else 0.0
+        row["unit"] = f"{unit_name}/s"
+    return row
+
+
+def print_report(rows):
+    print(f"{'stage':<38}{'p50 s':>10}{'p95 s':>10}{'p99 s':>10}{'throughput':>18}{'peak RSS MB':>14}")
+    for row in rows:
+        throughput = f"{row['throughput']:.1f} {row['unit']}" if "throughput" in row else "-"
+        peak_rss = "-" if row["peak_rss_mb"] is None else f"{row['peak_rss_mb']:.1f}"
+        print(
+            f"{row['stage']:<38}{row['p50']:>10.4f}{row['p95']:>10.4f}{row['p99']:>10.4f}"
+            f"{throughput:>18}{peak_rss:>14}"
+        )
+
+
+def save_baseline(path, rows):
+    with open(path, "w") as f:
+        json.dump({row["stage"]: row for row in rows}, f, indent=2)
+    print(f"Baseline saved to {path}")
+
+
+def compare_baseline(path, rows, tolerance):
+    """
+    Prints p50 changes against a saved baseline. Returns True when any stage
+    got slower by more than `tolerance` (a fraction, e.g. 0.1 for 10%).
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+
+    regressed = False
+    print(f"\nCompared with {path}:")
+    for row in rows:
+        old = baseline.get(row["stage"])
+        if not old or not old["p50"]:
+            print(f"  {row['stage']:<38} (new)")
+            continue
+        change = row["p50"] / old["p50"] - 1
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"  {row['stage']:<38}{old['p50']:>10.4f} -> {row['p50']:<10.4f}{change:>+8.1%}{flag}")
+    return regressed
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare results with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed p50 slowdown before a stage counts as regressed (default 0.10)")
+
+
+def finish(args, rows):
+    """Prints the report and handles --save-baseline/--compare; returns the exit code."""
+    print_report(rows)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, rows)
+    if args.compare and compare_baseline(args.compare, rows, args.tolerance):
+        return 1
+    return 0
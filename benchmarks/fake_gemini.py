@@ -0,0 +1,88 @@
+import asyncio
+import json
+import random
+
+WORDS = (
+    "lecture concept definition example theorem method result analysis model data "
+    "structure process system function value student question answer summary"
+).split()
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    def __init__(self, pieces, delay):
+        self._pieces = pieces
+        self._delay = delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for piece in self._pieces:
+            await asyncio.sleep(self._delay)
+            yield FakeResponse(piece)
+
+
+class FakeGeminiModel:
+    """
+    Offline stand-in for genai.GenerativeModel. Replies after `latency`
+    seconds with about `output_chars` characters of filler text; streamed
+    replies are split into `stream_pieces` pieces over the same latency.
+    In JSON mode the filler is a list of items carrying the fields of every
+    structured feature (see structured.py).
+    """
+
+    def __init__(self, name, latency=0.5, output_chars=4000, stream_pieces=20, seed=0):
+        self.name = name
+        self.latency = latency
+        self.output_chars = output_chars
+        self.stream_pieces = stream_pieces
+        self._random = random.Random(seed)
+
+    def _text(self):
+        words = []
+        size = 0
+        while size < self.output_chars:
+            word = self._random.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return " ".join(words)
+
+    def _words(self, count):
+        return " ".join(self._random.choice(WORDS) for _ in range(count))
+
+    def _json(self):
+        items = []
+        size = 0
+        while size < self.output_chars:
+            item = {
+                "question": self._words(12) + "?",
+                "options": [self._words(4) for _ in range(4)],
+                "answer": self._random.choice("ABCD"),
+                "type": self._random.choice(["very short", "short", "long"]),
+                "title": self._words(4).title(),
+                "bullets": [f"{self._words(2)}: {self._words(8)}" for _ in range(3)],
+            }
+            items.append(item)
+            size += len(json.dumps(item))
+        return json.dumps(items)
+
+    async def generate_content_async(self, prompt, stream=False, generation_config=None, **kwargs):
+        json_mode = (generation_config or {}).get("response_mime_type") == "application/json"
+        text = self._json() if json_mode else self._text()
+        if not stream:
+            await asyncio.sleep(self.latency)
+            return FakeResponse(text)
+
+        step = max(1, len(text) // self.stream_pieces)
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        return FakeStream(pieces, self.latency / len(pieces))
+
+
+def factory(latency=0.5, output_chars=4000):
+    """Returns a model_factory for llm.GeminiClient."""
+    return lambda name: FakeGeminiModel(name, latency=latency, output_chars=output_chars)
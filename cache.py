@@ -0,0 +1,241 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+CACHE_DIR = os.getenv("EDUSAGE_CACHE_DIR", ".cache")
+CHARS_PER_TOKEN = 4  # rough average for English prose
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# ---------------------- TEXT CACHE ----------------------
+class TextCache:
+    """
+    Two-tier text cache shared by every session in the process:
+    an in-memory LRU in front of a size-bounded directory on disk.
+    Keys are content hashes, so entries never need invalidating.
+    """
+
+    def __init__(self, name, max_items=32, max_disk_bytes=256 * 1024 * 1024):
+        self.name = name
+        self.dir = os.path.join(CACHE_DIR, name)
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.dir, f"{key}.txt")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                metrics.cache_result(self.name, True)
+                return self._mem[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)  # mark as recently used for disk eviction
+        except OSError:
+            metrics.cache_result(self.name, False)
+            return None
+        metrics.cache_result(self.name, True)
+
+        self._remember(key, text)
+        return text
+
+    def put(self, key, text):
+        self._remember(key, text)
+
+        os.makedirs(self.dir, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except OSError:
+            # The disk tier is best-effort; the memory tier still holds it.
+            return
+        self._evict_disk()
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._mem[key] = text
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".txt"):
+                        continue
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return
+
+        # Oldest-used first until we are back under the budget
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+# ---------------------- BYTES CACHE ----------------------
+class BytesCache:
+    """In-memory LRU of immutable bytes values, bounded by their total size."""
+
+    def __init__(self, max_bytes, name="bytes"):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self._items.move_to_end(key)
+                self.hits += 1
+        metrics.cache_result(self.name, data is not None)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+# ---------------------- RESPONSE CACHE ----------------------
+class ResponseCache:
+    """
+    SQLite-backed cache of LLM responses keyed on (model, feature, prompt).
+    Entries expire after ttl seconds and the least recently used ones are
+    evicted once there are more than max_entries.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @staticmethod
+    def key(model, feature, prompt):
+        normalized = re.sub(r"\s+", " ", prompt).strip()
+        return hash_bytes(f"{model}\0{feature or ''}\0{normalized}".encode("utf-8"))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                feature TEXT,
+                response TEXT,
+                created REAL,
+                last_used REAL
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def _count(self, hit):
+        metrics.cache_result("response", hit)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT response, created FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if row and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key=?", (key,))
+                conn.commit()
+                row = None
+            if row:
+                conn.execute("UPDATE responses SET last_used=? WHERE key=?", (now, key))
+                conn.commit()
+        finally:
+            conn.close()
+
+        self._count(row is not None)
+        return row[0] if row else None
+
+    def put(self, key, response, feature=None):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, feature, response, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, feature, response, now, now),
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            (entries,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        finally:
+            conn.close()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,168 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB = os.getenv("EDUSAGE_DB", "users.db")
+POOL_SIZE = int(os.getenv("EDUSAGE_DB_POOL", 8))
+BUSY_TIMEOUT_MS = int(os.getenv("EDUSAGE_DB_BUSY_TIMEOUT_MS", 30_000))
+
+
+# ---------------------- SCHEMA ----------------------
+def _add_column(conn, table, column, decl):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _v1_users(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        email TEXT UNIQUE,
+        password_hash BLOB
+    )
+    """)
+
+
+def _v2_artifacts(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS artifacts (
+        username TEXT,
+        filename TEXT,
+        kind TEXT,
+        source TEXT,
+        path TEXT,
+        size INTEGER,
+        mtime REAL,
+        PRIMARY KEY (username, filename)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS artifacts_kind ON artifacts (username, kind, source)")
+
+
+def _v3_versions(conn):
+    # Databases indexed before blobs existed have artifacts without the column
+    _add_column(conn, "artifacts", "blob", "TEXT")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS versions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        filename TEXT,
+        kind TEXT,
+        source TEXT,
+        blob TEXT,
+        size INTEGER,
+        created REAL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS versions_file ON versions (username, filename, created)")
+    conn.execute("CREATE INDEX IF NOT EXISTS versions_source ON versions (username, kind, source)")
+
+
+def _v4_documents(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        name TEXT,
+        source TEXT,
+        pages TEXT,
+        parent INTEGER,
+        created REAL,
+        UNIQUE (username, source)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS documents_user ON documents (username, created)")
+
+
+def _v5_documents_chunked(conn):
+    # Whether the document was generated in chunks (see revisions.record)
+    _add_column(conn, "documents", "chunked", "INTEGER DEFAULT 0")
+
+
+# Applied in order; PRAGMA user_version records how many have run. Only
+# ever append: a released migration must not change.
+MIGRATIONS = [_v1_users, _v2_artifacts, _v3_versions, _v4_documents, _v5_documents_chunked]
+
+
+class Database:
+    """
+    Pooled SQLite connections in WAL mode. Connections are reused across
+    calls (and Streamlit script threads), so each keeps its prepared-statement
+    cache, and the schema is migrated once per process on first use.
+    """
+
+    def __init__(self, path, migrations=MIGRATIONS, pool_size=POOL_SIZE):
+        self.path = path
+        self.migrations = migrations
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def migrate(self, conn=None):
+        """Brings the schema up to date; a no-op after the first call."""
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            own = conn is None
+            conn = conn or self._open()
+            try:
+                # BEGIN IMMEDIATE so concurrent processes migrate one at a time
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    version = conn.execute("PRAGMA user_version").fetchone()[0]
+                    for number, migration in enumerate(self.migrations[version:], version + 1):
+                        migration(conn)
+                        conn.execute(f"PRAGMA user_version={number}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                if own:
+                    conn.close()
+            self._ready = True
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a pooled connection for one transaction: committed when the
+        block exits normally, rolled back if it raises.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        self.migrate(conn)
+
+        try:
+            with conn:
+                yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+DATABASE = Database(DB)
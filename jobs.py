@@ -0,0 +1,334 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from cache import hash_bytes
+from nlp import FEATURES, PROMPT_VERSIONS
+from storage import save_exports
+
+JOBS_DB = os.getenv("EDUSAGE_JOBS_DB", "jobs.db")
+JOB_WORKERS = int(os.getenv("EDUSAGE_JOB_WORKERS", 8))
+PARTIAL_INTERVAL = 0.5  # seconds between partial-result writes
+# Each process refreshes its unfinished jobs every HEARTBEAT_SECONDS; a job
+# not refreshed for STALE_SECONDS belongs to a process that has gone away
+# and is taken over. PIDs can't tell: a restarted container reuses them.
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = int(os.getenv("EDUSAGE_JOB_STALE_SECONDS", 60))
+PROCESS_ID = uuid.uuid4().hex
+# Finished jobs (and their subscribers) are deleted after JOB_TTL_SECONDS,
+# checked every PRUNE_SECONDS; their results stay in the results table until
+# RESULT_TTL_SECONDS, or until more than RESULT_MAX_ENTRIES push out the oldest
+JOB_TTL_SECONDS = int(os.getenv("EDUSAGE_JOB_TTL_HOURS", 24)) * 3600
+RESULT_TTL_SECONDS = int(os.getenv("EDUSAGE_RESULT_TTL_HOURS", 7 * 24)) * 3600
+RESULT_MAX_ENTRIES = int(os.getenv("EDUSAGE_RESULT_ENTRIES", 5000))
+PRUNE_SECONDS = 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Persistent generation queue. Jobs are rows in SQLite and run on a
+    worker pool outside the Streamlit script thread, so they survive reruns
+    and widget interactions; the UI polls them by id.
+
+    Results are shared between users: finished generations are kept per
+    (document, feature, prompt version), and a request for one is served
+    from there straight away. A request identical to one still queued or
+    running, from any user, subscribes to that job instead of starting
+    another; every subscriber gets the exports when it finishes.
+    """
+
+    def __init__(self, path, workers):
+        self.path = path
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="edusage-job")
+        self._lock = threading.Lock()
+        self._ready = False
+        self._pruned = 0.0
+        threading.Thread(target=self._heartbeat, name="edusage-job-heartbeat", daemon=True).start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                key TEXT,
+                username TEXT,
+                feature TEXT,
+                payload TEXT,
+                status TEXT,
+                result TEXT,
+                error TEXT,
+                owner TEXT,
+                created REAL,
+                updated REAL
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated)")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS subscribers (
+                job_id TEXT,
+                username TEXT,
+                source TEXT,
+                PRIMARY KEY (job_id, username)
+            )
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                feature TEXT,
+                version INTEGER,
+                result TEXT,
+                created REAL
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def _update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name}=?" for name in fields)
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id=?", (*fields.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def result_key(feature, text):
+        """Shared-result key: the document's content hash, feature and prompt version."""
+        document = hash_bytes(text.encode("utf-8"))
+        return hash_bytes(f"{document}\0{feature}\0{PROMPT_VERSIONS[feature]}".encode("utf-8"))
+
+    def shared_result(self, feature, text):
+        """A finished result for this document and feature from any user, or None."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT result FROM results WHERE key=? AND created>=?",
+                (self.result_key(feature, text), time.time() - RESULT_TTL_SECONDS),
+            ).fetchone()
+        finally:
+            conn.close()
+        return row["result"] if row else None
+
+    def submit(self, username, feature, text, use_cache=True, source=None, force=False, incremental=False):
+        """
+        Queues a feature run for a user's document and returns the job id.
+        `source` (the PDF hash) is recorded on the saved artifacts. `force`
+        skips shared and cached results and generates afresh. `incremental`
+        marks a revision of a chunked document (see revisions.record).
+        """
+        use_cache = use_cache and not force
+        result_key = self.result_key(feature, text)
+        # Fresh and cached runs of the same document are merged separately
+        key = hash_bytes(f"{result_key}\0{int(use_cache)}".encode("utf-8"))
+        shared = self.shared_result(feature, text) if use_cache else None
+        # Only a job that still has to run needs the document
+        payload = None if shared is not None else json.dumps(
+            {"text": text, "use_cache": use_cache, "incremental": incremental}
+        )
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = None
+                stale = False
+                if shared is None:
+                    row = conn.execute(
+                        "SELECT id, updated FROM jobs WHERE key=? AND status IN (?, ?)", (key, QUEUED, RUNNING)
+                    ).fetchone()
+                if row:
+                    job_id = row["id"]
+                    # Left behind by a dead process: take it over rather than wait on it forever
+                    stale = row["updated"] < time.time() - STALE_SECONDS and self._claim(conn, job_id)
+                else:
+                    job_id = uuid.uuid4().hex
+                    now = time.time()
+                    conn.execute(
+                        "INSERT INTO jobs (id, key, username, feature, payload, status, result, owner, created, updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, key, username, feature, payload, DONE if shared is not None else QUEUED,
+                         shared, PROCESS_ID, now, now),
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO subscribers (job_id, username, source) VALUES (?, ?, ?)",
+                    (job_id, username, source),
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+        if shared is not None:
+            self._pool.submit(save_exports, username, feature, shared, source)
+        elif not row or stale:
+            self._enqueue(job_id)
+        return job_id
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT id, feature, status, result, error, created, updated FROM jobs WHERE id=?",
+                (job_id,),
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def _enqueue(self, job_id):
+        metrics.gauge_add("edusage_queue_depth", 1, queue="jobs")
+        self._pool.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        try:
+            self._run_job(job_id)
+        finally:
+            metrics.gauge_add("edusage_queue_depth", -1, queue="jobs")
+
+    def _run_job(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT username, feature, payload, created FROM jobs WHERE id=?", (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None or row["payload"] is None:
+            return
+
+        payload = json.loads(row["payload"])
+        metrics.observe("edusage_stage_seconds", time.time() - row["created"], stage="job_wait", feature=row["feature"])
+        self._update(job_id, status=RUNNING)
+        try:
+            # Stream so the UI can show partial text while polling
+            pieces = []
+            last_write = time.monotonic()
+            stream = FEATURES[row["feature"]](
+                payload["text"], use_cache=payload["use_cache"], stream=True,
+                incremental=payload.get("incremental", False),
+            )
+            for piece in stream:
+                pieces.append(piece)
+                if time.monotonic() - last_write >= PARTIAL_INTERVAL:
+                    self._update(job_id, result="".join(pieces))
+                    last_write = time.monotonic()
+
+            result = "".join(pieces)
+            self._finish(job_id, row["feature"], payload["text"], result)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), payload=None)
+
+    def _finish(self, job_id, feature, text, result):
+        # Under the submit lock, so no subscriber joins after the list is read
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, feature, version, result, created) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.result_key(feature, text), feature, PROMPT_VERSIONS[feature], result, time.time()),
+                )
+                conn.execute(
+                    "UPDATE jobs SET status=?, result=?, payload=NULL, updated=? WHERE id=?",
+                    (DONE, result, time.time(), job_id),
+                )
+                subscribers = conn.execute(
+                    "SELECT username, source FROM subscribers WHERE job_id=?", (job_id,)
+                ).fetchall()
+                conn.commit()
+            finally:
+                conn.close()
+
+        for subscriber in subscribers:
+            save_exports(subscriber["username"], feature, result, subscriber["source"])
+
+    @staticmethod
+    def _claim(conn, job_id):
+        # Atomic, in case several processes recover the same job at once
+        now = time.time()
+        return conn.execute(
+            "UPDATE jobs SET status=?, owner=?, updated=? WHERE id=? AND status IN (?, ?) AND updated<?",
+            (QUEUED, PROCESS_ID, now, job_id, QUEUED, RUNNING, now - STALE_SECONDS),
+        ).rowcount
+
+    def recover(self):
+        """Re-queues unfinished jobs whose process stopped refreshing them (see STALE_SECONDS)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND updated<?",
+                (QUEUED, RUNNING, time.time() - STALE_SECONDS),
+            ).fetchall()
+            claimed = [row["id"] for row in rows if self._claim(conn, row["id"])]
+            conn.commit()
+        finally:
+            conn.close()
+        for job_id in claimed:
+            self._enqueue(job_id)
+
+    def prune(self):
+        """
+        Deletes finished jobs last updated more than JOB_TTL_SECONDS ago, and
+        their subscribers, then expires shared results the same way
+        ResponseCache does: older than RESULT_TTL_SECONDS, or the oldest past
+        RESULT_MAX_ENTRIES.
+        """
+        self._pruned = time.time()
+        conn = self._connect()
+        try:
+            params = (DONE, FAILED, time.time() - JOB_TTL_SECONDS)
+            conn.execute(
+                "DELETE FROM subscribers WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?) AND updated<?)",
+                params,
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated<?", params)
+            conn.execute("DELETE FROM results WHERE created<?", (time.time() - RESULT_TTL_SECONDS,))
+            (count,) = conn.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > RESULT_MAX_ENTRIES:
+                conn.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY created LIMIT ?)",
+                    (count - RESULT_MAX_ENTRIES,),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute(
+                        "UPDATE jobs SET updated=? WHERE owner=? AND status IN (?, ?)",
+                        (time.time(), PROCESS_ID, QUEUED, RUNNING),
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+                self.recover()
+                if time.time() - self._pruned >= PRUNE_SECONDS:
+                    self.prune()
+            except sqlite3.Error:
+                pass  # busy database; try again on the next beat
+
+
+JOBS = JobQueue(JOBS_DB, JOB_WORKERS)
+JOBS.recover()
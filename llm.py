@@ -0,0 +1,218 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from functools import lru_cache
+
+import metrics
+
+# Client settings. TIMEOUT is the deadline for a whole call, retries included.
+MAX_CONCURRENCY = int(os.getenv("EDUSAGE_LLM_CONCURRENCY", 8))
+REQUESTS_PER_MINUTE = float(os.getenv("EDUSAGE_LLM_RPM", 60))
+BURST = int(os.getenv("EDUSAGE_LLM_BURST", 10))
+MAX_RETRIES = int(os.getenv("EDUSAGE_LLM_RETRIES", 5))
+TIMEOUT = float(os.getenv("EDUSAGE_LLM_TIMEOUT", 180))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+@lru_cache(maxsize=None)
+def genai():
+    """
+    google.generativeai, imported and configured on first use: importing
+    it takes most of a second, which the login page shouldn't wait for.
+    """
+    import google.generativeai
+
+    # Load Gemini API Key
+    google.generativeai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return google.generativeai
+
+
+@lru_cache(maxsize=None)
+def retryable():
+    """429s and 5xx responses are worth retrying; anything else is a real error."""
+    from google.api_core import exceptions as google_exceptions
+
+    return (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServerError,
+        asyncio.TimeoutError,
+    )
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` saved up."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class GeminiClient:
+    """
+    Shared Gemini client. All requests run on one background event loop,
+    which bounds concurrency, applies the rate limit and retries transient
+    failures with jittered exponential backoff. Model handles are reused.
+    """
+
+    def __init__(self, concurrency=MAX_CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE,
+                 burst=BURST, retries=MAX_RETRIES, timeout=TIMEOUT, model_factory=None):
+        self.model_factory = model_factory
+        self.retries = retries
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(requests_per_minute / 60, burst)
+        self._models = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def model(self, name):
+        if name not in self._models:
+            factory = self.model_factory or genai().GenerativeModel
+            self._models[name] = factory(name)
+        return self._models[name]
+
+    async def generate_async(self, prompt, model, timeout=None, **kwargs):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        handle = self.model(model)
+
+        for attempt in range(self.retries + 1):
+            await self._bucket.acquire()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Gemini call exceeded its {timeout or self.timeout}s deadline")
+
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        handle.generate_content_async(prompt, **kwargs), remaining
+                    )
+                return response.text
+            except retryable():
+                if attempt == self.retries:
+                    raise
+                metrics.inc("edusage_llm_retries_total")
+
+            # Full jitter keeps a classroom of retries from lining up again
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                raise TimeoutError(f"Gemini call exceeded its {timeout or self.timeout}s deadline")
+            await asyncio.sleep(delay)
+
+    async def stream_async(self, prompt, model, timeout=None, **kwargs):
+        """
+        Yields the response text piece by piece as the model produces it.
+        Failures are retried only until the first piece has been yielded.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        handle = self.model(model)
+
+        for attempt in range(self.retries + 1):
+            await self._bucket.acquire()
+            if deadline - time.monotonic() <= 0:
+                raise TimeoutError(f"Gemini call exceeded its {timeout or self.timeout}s deadline")
+
+            started = False
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        handle.generate_content_async(prompt, stream=True, **kwargs),
+                        deadline - time.monotonic(),
+                    )
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                chunks.__anext__(), deadline - time.monotonic()
+                            )
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield chunk.text
+            except retryable():
+                if started or attempt == self.retries:
+                    raise
+                metrics.inc("edusage_llm_retries_total")
+
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                raise TimeoutError(f"Gemini call exceeded its {timeout or self.timeout}s deadline")
+            await asyncio.sleep(delay)
+
+    def _event_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="gemini-client", daemon=True
+                ).start()
+        return self._loop
+
+    def generate(self, prompt, model, timeout=None, **kwargs):
+        """Blocking wrapper around generate_async, safe to call from any thread."""
+        self.model(model)  # first use imports the SDK; keep that off the event loop
+        future = asyncio.run_coroutine_threadsafe(
+            self.generate_async(prompt, model, timeout, **kwargs), self._event_loop()
+        )
+        metrics.gauge_add("edusage_queue_depth", 1, queue="llm")
+        try:
+            return future.result()
+        finally:
+            metrics.gauge_add("edusage_queue_depth", -1, queue="llm")
+
+    def stream(self, prompt, model, timeout=None, **kwargs):
+        """Blocking generator around stream_async, safe to iterate from any thread."""
+        self.model(model)
+        pieces = queue.Queue()
+
+        async def pump():
+            try:
+                async for piece in self.stream_async(prompt, model, timeout, **kwargs):
+                    pieces.put((piece, None))
+                pieces.put((None, None))
+            except Exception as e:
+                pieces.put((None, e))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._event_loop())
+        metrics.gauge_add("edusage_queue_depth", 1, queue="llm")
+        try:
+            while True:
+                piece, error = pieces.get()
+                if error is not None:
+                    raise error
+                if piece is None:
+                    return
+                yield piece
+        finally:
+            future.cancel()
+            metrics.gauge_add("edusage_queue_depth", -1, queue="llm")
+
+
+_client_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # The shared `client` is created on first use rather than at import
+    global client
+    if name != "client":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _client_lock:
+        if "client" not in globals():
+            client = GeminiClient()
+    return client
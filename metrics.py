@@ -0,0 +1,245 @@
+"""
+In-process metrics: timers, histograms, counters and gauges, exported in
+Prometheus text format.
+
+    EDUSAGE_METRICS=0              switch all instrumentation off
+    EDUSAGE_METRICS_FILE=path      rewrite a .prom file every METRICS_INTERVAL s
+    EDUSAGE_METRICS_PORT=9464      serve /metrics over HTTP
+    EDUSAGE_TRACE_LOG=trace.jsonl  append one JSON line per timed stage
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+ENABLED = os.getenv("EDUSAGE_METRICS", "1") != "0"
+METRICS_FILE = os.getenv("EDUSAGE_METRICS_FILE")
+METRICS_PORT = int(os.getenv("EDUSAGE_METRICS_PORT", 0))
+METRICS_INTERVAL = float(os.getenv("EDUSAGE_METRICS_INTERVAL", 15))
+TRACE_LOG = os.getenv("EDUSAGE_TRACE_LOG")
+
+# Upper bounds in seconds for stage timings, and in tokens for sizes
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 500, 1_000, 5_000, 10_000, 50_000, 100_000, 250_000, 1_000_000)
+
+HELP = {
+    "edusage_stage_seconds": "Time spent per pipeline stage",
+    "edusage_prompt_tokens": "Estimated prompt size per LLM call",
+    "edusage_response_tokens": "Estimated response size per LLM call",
+    "edusage_cache_requests_total": "Cache lookups by cache and result",
+    "edusage_llm_retries_total": "LLM calls retried after a transient error",
+    "edusage_errors_total": "Stages that raised",
+    "edusage_queue_depth": "Work waiting or running, per queue",
+    "edusage_preprocess_tokens_saved_total": "Prompt tokens removed by preprocessing",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_buckets = {}  # name -> bucket bounds
+_trace_lock = threading.Lock()
+
+
+def set_enabled(flag):
+    global ENABLED
+    ENABLED = bool(flag)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+# ---------------------- RECORDING ----------------------
+def inc(name, value=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge_add(name, value, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + value
+
+
+def observe(name, value, buckets=TIME_BUCKETS, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _buckets.setdefault(name, buckets)
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(buckets) + 2)
+        counts[bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+
+def cache_result(cache, hit):
+    inc("edusage_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def tokens(name, text, **labels):
+    """Records the estimated token count of a prompt or response."""
+    if ENABLED and text is not None:
+        from cache import estimate_tokens  # cache imports metrics
+
+        observe(name, estimate_tokens(text), TOKEN_BUCKETS, **labels)
+
+
+def trace(stage, seconds, **fields):
+    if not (ENABLED and TRACE_LOG):
+        return
+    record = {"ts": round(time.time(), 3), "stage": stage, "seconds": round(seconds, 6),
+              "thread": threading.current_thread().name}
+    record.update({k: v for k, v in fields.items() if v is not None})
+    line = json.dumps(record)
+    with _trace_lock:
+        with open(TRACE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def timer(stage, **labels):
+    """Times the block into edusage_stage_seconds{stage=...} and the trace log."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        inc("edusage_errors_total", stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("edusage_stage_seconds", elapsed, stage=stage, **labels)
+        trace(stage, elapsed, error=error, **labels)
+
+
+def timed(stage):
+    """Decorator form of timer()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(pieces, stage, **labels):
+    """Times a generator from the first request to exhaustion."""
+    with timer(stage, **labels):
+        yield from pieces
+
+
+# ---------------------- EXPORT ----------------------
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: list(counts) for key, counts in _histograms.items()}
+        buckets = dict(_buckets)
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, "gauge")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), counts in sorted(histograms.items()):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(buckets[name] + (float("inf"),), counts[:-1]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{name}_bucket{_labels(labels, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {counts[-1]:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path=None):
+    path = path or METRICS_FILE
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+_started = False
+
+
+def start_exporters():
+    """Starts the file writer and/or HTTP endpoint configured above, once per process."""
+    global _started
+    with _lock:
+        if _started or not ENABLED:
+            return
+        _started = True
+
+    if METRICS_FILE:
+        def writer():
+            while True:
+                time.sleep(METRICS_INTERVAL)
+                try:
+                    write()
+                except OSError:
+                    pass
+        threading.Thread(target=writer, name="edusage-metrics-file", daemon=True).start()
+
+    if METRICS_PORT:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), Handler)
+        except OSError:
+            return  # another process (e.g. a second Streamlit worker) already serves it
+        threading.Thread(target=server.serve_forever, name="edusage-metrics-http", daemon=True).start()
@@ -1,30 +1,232 @@
-import google.generativeai as genai
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Load Gemini API Key
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+import llm
+import metrics
+import structured
+from cache import CHARS_PER_TOKEN, ResponseCache, estimate_tokens, hash_bytes
 
 MODEL = "models/gemini-2.5-flash"
 
+# Documents longer than CHUNK_TOKENS are split into chunks, each chunk is
+# processed by a "map" prompt (up to MAP_CONCURRENCY at a time) and the
+# partial results are merged by a final "reduce" prompt.
+CHUNK_TOKENS = int(os.getenv("EDUSAGE_CHUNK_TOKENS", 100_000))
+MAP_CONCURRENCY = int(os.getenv("EDUSAGE_MAP_CONCURRENCY", 4))
+
+# Documents too long for one prompt, and revisions of them
+# (incremental=True, see revisions.record), are mapped in smaller chunks of
+# INCREMENTAL_CHUNK_TOKENS, so a later revision only re-prompts the chunks
+# around its changed pages (0 turns this off). Chunks end at page
+# boundaries picked by page content (see chunk_text), which keeps the
+# other chunks, and so their map prompts, the same between revisions. A
+# document that fits in CHUNK_TOKENS is otherwise sent as one (streamed)
+# prompt.
+INCREMENTAL_CHUNK_TOKENS = int(os.getenv("EDUSAGE_INCREMENTAL_CHUNK_TOKENS", 8_000))
+BOUNDARY_ODDS = 4  # about one page in BOUNDARY_ODDS may end a chunk
+
+# Responses are cached next to users.db so repeat uploads of the same
+# material do not pay for the same generation twice.
+RESPONSE_CACHE = ResponseCache(
+    os.getenv("EDUSAGE_RESPONSE_CACHE_DB", "response_cache.db"),
+    ttl=int(os.getenv("EDUSAGE_RESPONSE_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.getenv("EDUSAGE_RESPONSE_CACHE_ENTRIES", 5000)),
+)
+
+# No part numbers: the prompt for a chunk must not change when chunks
+# before it do, or revisions could not reuse its cached response
+MAP_PROMPT = """
+    The text below is one consecutive part of a longer document.
+    {instruction}
+
+    Text:
+    {text}
+    """
+
+REDUCE_PREFIX = """
+    The text below is made of partial results, each produced from one
+    consecutive part of a longer document. Treat them together as the
+    whole document: merge them, remove duplicates and keep the requested
+    format and counts.
+    """
+
+# Retrieval queries for the focused features: long documents are cut down
+# to the passages that best match them (see retrieval.focus)
+SECTION_QUERIES = [
+    "abstract summary overview introduction",
+    "objective aim purpose goal research question problem motivation",
+    "method methodology approach procedure experiment design data model",
+    "results findings observed show performance evaluation analysis",
+    "conclusion conclude summary future work limitations",
+    "significance implications impact importance applications contribution",
+]
+ASSIGNMENT_QUERIES = [
+    "definition concept principle theory",
+    "example application problem solution",
+    "process method steps algorithm procedure",
+    "compare difference advantages disadvantages",
+]
+
 # ------------------------ HELPERS ------------------------
-def call_gemini(prompt):
-    model = genai.GenerativeModel(MODEL)
-    response = model.generate_content(prompt)
-    return response.text
+def call_gemini(prompt, feature=None, use_cache=True, timeout=None, generation_config=None):
+    """
+    Sends prompt to the model through the shared llm client (rate limited,
+    retried, with a per-call deadline of `timeout` seconds). Responses are
+    served from RESPONSE_CACHE when possible; pass use_cache=False to force
+    a fresh generation (the new response still replaces the cached one).
+    generation_config is passed to the model as-is (e.g. for JSON mode).
+    """
+    key = ResponseCache.key(MODEL, feature, prompt)
+    if use_cache:
+        cached = RESPONSE_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+    metrics.tokens("edusage_prompt_tokens", prompt, feature=feature)
+    with metrics.timer("llm", feature=feature):
+        text = llm.client.generate(prompt, MODEL, timeout=timeout, **_config(generation_config))
+    metrics.tokens("edusage_response_tokens", text, feature=feature)
+    RESPONSE_CACHE.put(key, text, feature)
+    return text
+
+
+def call_gemini_stream(prompt, feature=None, use_cache=True, timeout=None, generation_config=None):
+    """Like call_gemini, but yields the response in pieces as it is generated."""
+    key = ResponseCache.key(MODEL, feature, prompt)
+    if use_cache:
+        cached = RESPONSE_CACHE.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    metrics.tokens("edusage_prompt_tokens", prompt, feature=feature)
+    pieces = []
+    with metrics.timer("llm", feature=feature):
+        for piece in llm.client.stream(prompt, MODEL, timeout=timeout, **_config(generation_config)):
+            pieces.append(piece)
+            yield piece
+    text = "".join(pieces)
+    metrics.tokens("edusage_response_tokens", text, feature=feature)
+    RESPONSE_CACHE.put(key, text, feature)
+
+
+def _config(generation_config):
+    return {"generation_config": generation_config} if generation_config else {}
+
+
+def _boundary(page):
+    return int(hash_bytes(page.encode("utf-8"))[:8], 16) % BOUNDARY_ODDS == 0
+
+
+def chunk_text(text, max_tokens=None):
+    """
+    Splits text into chunks of at most max_tokens (estimated), breaking on
+    page boundaries (blank lines) first and on line boundaries only for
+    pages that are too long on their own.
+    Once a chunk is half full it also ends after any page whose hash picks
+    it as a boundary. Those breaks depend only on nearby pages, so an edit
+    changes the chunks around it and leaves the others as they were.
+    """
+    max_chars = (max_tokens or CHUNK_TOKENS) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    # (separator, piece) pairs so that re-joining keeps the original breaks
+    pieces = []
+    for page in text.split("\n\n"):
+        if len(page) <= max_chars:
+            pieces.append(("\n\n", page))
+            continue
+        sep = "\n\n"
+        for line in page.split("\n"):
+            while len(line) > max_chars:
+                pieces.append((sep, line[:max_chars]))
+                line = line[max_chars:]
+                sep = ""
+            pieces.append((sep, line))
+            sep = "\n"
+
+    chunks = []
+    current = ""
+    for n, (sep, piece) in enumerate(pieces):
+        if current and len(current) + len(sep) + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}{sep}{piece}" if current else piece
+        page_ends = n + 1 == len(pieces) or pieces[n + 1][0] == "\n\n"
+        if page_ends and len(current) >= max_chars // 2 and _boundary(piece):
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def run_chunked(prompt, text, map_instruction, feature=None, use_cache=True,
+                stream=False, chunk_tokens=None, concurrency=None, generation_config=None, incremental=False):
+    """
+    Runs a feature prompt (a template with a {text} placeholder) over text.
+    Text that fits in one chunk is sent as-is; longer text goes through
+    concurrent per-chunk map prompts and one reduce prompt.
+    With stream=True the (final) response is returned as a generator of
+    text pieces instead of a string. generation_config applies to the final
+    prompt only; map prompts reply in free text. incremental=True maps a
+    revision of a chunked document in small content-defined chunks (see
+    INCREMENTAL_CHUNK_TOKENS). Each run is timed as stage "feature".
+    """
+    args = (prompt, text, map_instruction, feature, use_cache, stream, chunk_tokens, concurrency,
+            generation_config, incremental)
+    if stream:
+        # Wrapped lazily so that the timer also covers the map prompts
+        def pieces():
+            yield from _run_chunked(*args)
+        return metrics.timed_iter(pieces(), "feature", feature=feature)
+    with metrics.timer("feature", feature=feature):
+        return _run_chunked(*args)
+
+
+def _run_chunked(prompt, text, map_instruction, feature, use_cache, stream, chunk_tokens, concurrency,
+                 generation_config, incremental):
+    call = call_gemini_stream if stream else call_gemini
+    if chunk_tokens is None and INCREMENTAL_CHUNK_TOKENS and (incremental or estimate_tokens(text) > CHUNK_TOKENS):
+        chunk_tokens = min(INCREMENTAL_CHUNK_TOKENS, CHUNK_TOKENS)
+    chunks = chunk_text(text, chunk_tokens)
+    if len(chunks) <= 1:
+        return call(prompt.format(text=text), feature, use_cache, generation_config=generation_config)
+
+    map_prompts = [MAP_PROMPT.format(instruction=map_instruction, text=chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=concurrency or MAP_CONCURRENCY) as pool:
+        partials = list(pool.map(
+            lambda p: call_gemini(p, f"{feature}:map", use_cache), map_prompts
+        ))
+
+    merged = "\n\n".join(
+        f"--- Part {i} ---\n{partial}" for i, partial in enumerate(partials, 1)
+    )
+    return call(REDUCE_PREFIX + prompt.format(text=merged), feature, use_cache, generation_config=generation_config)
 
 # ------------------------ FEATURES ------------------------
 
-def summarize_text(text):
-    prompt = f"""
+def summarize_text(text, use_cache=True, stream=False, incremental=False):
+    prompt = """
     Summarize the following text into clean, clear academic notes:
 
     {text}
     """
-    return call_gemini(prompt)
-
-
-def section_wise_summaries(text):
-    prompt = f"""
+    return run_chunked(
+        prompt,
+        text,
+        "Write detailed academic notes covering every concept, definition and example in this part.",
+        feature="notes",
+        use_cache=use_cache,
+        stream=stream,
+        incremental=incremental,
+    )
+
+
+def section_wise_summaries(text, use_cache=True, stream=False, incremental=False):
+    prompt = """
     Read the following text and generate a research-paper-style summary.
     Divide it into the following sections:
 
@@ -40,64 +242,109 @@ def section_wise_summaries(text):
     Text:
     {text}
     """
-    return call_gemini(prompt)
+    import retrieval  # NumPy/SciPy load on first use
+
+    return run_chunked(
+        prompt,
+        retrieval.focus(text, SECTION_QUERIES),
+        "Summarize the objectives, methods, findings and conclusions that appear in this part.",
+        feature="sections",
+        use_cache=use_cache,
+        stream=stream,
+        incremental=incremental,
+    )
 
 
 
-def create_question_bank(text):
-    prompt = f"""
+# JSON shape of one item of each structured feature (see structured.py).
+# Braces are doubled because the prompts go through str.format.
+ITEM_SCHEMAS = {
+    "questions_mcq": '{{"question": "...", "options": ["...", "...", "...", "..."], "answer": "A"}}',
+    "questions_written": '{{"type": "very short" | "short" | "long", "question": "..."}}',
+    "ppt": '{{"title": "...", "bullets": ["Subtopic: one short sentence", "..."]}}',
+}
+
+
+def create_question_bank(text, use_cache=True, stream=False, incremental=False):
+    prompt = """
     Generate 25 high-quality MCQs from the following text.
-    For each MCQ, include:
-    - Question
-    - 4 options (A/B/C/D)
-    - Correct answer only
+    Each MCQ has a question, 4 options and the letter (A/B/C/D) of the
+    correct option.
+
+    Reply with JSON only: {{"questions": [ITEM, ...]}} where each ITEM is
+    """ + ITEM_SCHEMAS["questions_mcq"] + """
 
     Text:
     {text}
     """
-    return call_gemini(prompt)
-
-
-def create_written_answer_questions(text):
-    prompt = f"""
+    return run_chunked(
+        prompt,
+        text,
+        "Generate 10 high-quality MCQs (question, 4 options A/B/C/D, correct answer) from this part.",
+        feature="questions_mcq",
+        use_cache=use_cache,
+        stream=stream,
+        incremental=incremental,
+        generation_config=structured.JSON_CONFIG,
+    )
+
+
+def create_written_answer_questions(text, use_cache=True, stream=False, incremental=False):
+    prompt = """
     Using the text below, generate:
     - 10 very short answer questions
     - 10 short answer questions
     - 10 long answer / essay questions
 
+    Reply with JSON only: {{"questions": [ITEM, ...]}} where each ITEM is
+    """ + ITEM_SCHEMAS["questions_written"] + """
+
     Text:
     {text}
     """
-    return call_gemini(prompt)
-
+    return run_chunked(
+        prompt,
+        text,
+        "Generate 5 very short, 5 short and 5 long answer questions from this part.",
+        feature="questions_written",
+        use_cache=use_cache,
+        stream=stream,
+        incremental=incremental,
+        generation_config=structured.JSON_CONFIG,
+    )
 
-def create_ppt_outline(text):
-    prompt = f"""
-    Create a clean structured PowerPoint outline.
 
-    Format EXACTLY like this:
+def create_ppt_outline(text, use_cache=True, stream=False, incremental=False):
+    prompt = """
+    Create a clean structured PowerPoint outline of 10–12 slides. Each
+    slide has a title and 2–5 bullets of the form "Subtopic: one short
+    sentence".
 
-    Slide Title
-    - Subtopic: one short sentence
-    - Subtopic: one short sentence
+    Reply with JSON only: {{"slides": [SLIDE, ...]}} where each SLIDE is
+    """ + ITEM_SCHEMAS["ppt"] + """
 
-    Slide Title 2
-    - Subtopic: one short sentence
-    - Subtopic: one short sentence
-
-    Generate 10–12 slides based on this text:
+    Base the slides on this text:
 
     {text}
     """
-    return call_gemini(prompt)
-
-
-def generate_group_assignments(pdf_text):
+    return run_chunked(
+        prompt,
+        text,
+        "List the main topics of this part as slide titles, each with short one-sentence subtopics.",
+        feature="ppt",
+        use_cache=use_cache,
+        stream=stream,
+        incremental=incremental,
+        generation_config=structured.JSON_CONFIG,
+    )
+
+
+def generate_group_assignments(pdf_text, use_cache=True, stream=False, incremental=False):
     """
     Generates 3 unique assignments for 3 groups based on the PDF content.
     Each group has 3 questions worth 2.5 marks each (total 7.5 marks).
     """
-    prompt = f"""
+    prompt = """
     Using the following PDF content, generate assignments for 3 groups:
     
     - Each group gets 3 unique, clear, academic questions directly related to the content.
@@ -123,7 +370,124 @@ def generate_group_assignments(pdf_text):
     3. Question 3 (2.5 marks)
 
     PDF content:
-    {pdf_text}
+    {text}
+    """
+    import retrieval
+
+    return run_chunked(
+        prompt,
+        retrieval.focus(pdf_text, ASSIGNMENT_QUERIES),
+        "List the key concepts in this part that would make good academic assignment questions.",
+        feature="assignments",
+        use_cache=use_cache,
+        stream=stream,
+        incremental=incremental,
+    )
+
+
+# ------------------------ BATCH ------------------------
+
+# Feature functions keyed by the names used for st.session_state.generated
+FEATURES = {
+    "notes": summarize_text,
+    "ppt": create_ppt_outline,
+    "sections": section_wise_summaries,
+    "questions_mcq": create_question_bank,
+    "questions_written": create_written_answer_questions,
+    "assignments": generate_group_assignments,
+}
+
+# Bump a feature's version whenever its prompt changes, so results shared
+# between users (see jobs.py) are regenerated instead of served stale
+PROMPT_VERSIONS = {
+    "notes": 2,
+    "ppt": 3,
+    "sections": 3,
+    "questions_mcq": 3,
+    "questions_written": 3,
+    "assignments": 3,
+}
+
+
+def generate_all(text, keys=None, use_cache=True):
+    """
+    Runs several features concurrently and yields (key, result, error)
+    as each one finishes, so wall-clock time tracks the slowest feature.
     """
-    return call_gemini(prompt)
+    keys = list(keys or FEATURES)
+    with ThreadPoolExecutor(max_workers=max(len(keys), 1)) as pool:
+        futures = {
+            pool.submit(FEATURES[key], text, use_cache=use_cache): key for key in keys
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
 
+
+# ------------------------ REGENERATION ------------------------
+
+# Document text sent with a regeneration prompt, in tokens
+REGENERATE_BUDGET = int(os.getenv("EDUSAGE_REGENERATE_BUDGET", 2000))
+
+REGENERATE_PROMPT = """
+    Below are excerpts from a document and {noun} already generated from it.
+    Write {count} new {noun} to replace the ones listed under "Replace".
+    Each must differ from every item listed below and be answerable from
+    the excerpts.
+
+    Reply with JSON only: a list of {count} items, each shaped like
+    {schema}
+
+    Keep:
+    {kept}
+
+    Replace:
+    {replaced}
+
+    Excerpts:
+    {text}
+    """
+ITEM_NOUNS = {
+    "questions_mcq": "MCQs",
+    "questions_written": "questions",
+    "ppt": "slides",
+}
+
+
+def regenerate_items(feature, text, model, indices, use_cache=False):
+    """
+    Replaces the items at `indices` of a structured result (see
+    structured.py) using one small prompt instead of a full generation:
+    the other items go in as one-line labels so they are not repeated, and
+    the document is cut down to the passages closest to the items being
+    replaced. Returns the new model.
+    """
+    import retrieval
+
+    kind = model["kind"]
+    items = list(structured.items(model))
+    indices = sorted(i for i in set(indices) if 0 <= i < len(items))
+    if not indices:
+        return model
+
+    def single(i):
+        return structured.to_text({"kind": kind, structured.ITEMS[kind]: [items[i]]})
+
+    prompt = REGENERATE_PROMPT.format(
+        noun=ITEM_NOUNS[feature],
+        count=len(indices),
+        schema=ITEM_SCHEMAS[feature].format(),
+        kept="\n".join(structured.label(model, i) for i in range(len(items)) if i not in indices) or "(none)",
+        replaced="\n\n".join(single(i) for i in indices),
+        text=retrieval.focus(text, [single(i) for i in indices], REGENERATE_BUDGET),
+    )
+    reply = call_gemini(prompt, f"{feature}:regenerate", use_cache, generation_config=structured.JSON_CONFIG)
+
+    # Items the reply is short of keep their old version
+    for i, item in zip(indices, structured.parse_items(kind, reply)):
+        if kind == "written":
+            item["type"] = items[i]["type"]
+        items[i] = item
+    return {"kind": kind, structured.ITEMS[kind]: items}
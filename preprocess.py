@@ -0,0 +1,158 @@
+import os
+import re
+from collections import Counter
+
+import metrics
+from cache import TextCache, estimate_tokens, hash_bytes
+
+PREPROCESS_VERSION = 2  # bump when the cleaned output changes
+
+# A line counts as a running header/footer when it sits in the first or
+# last EDGE_LINES of at least BOILERPLATE_SHARE of the pages (and of at
+# least BOILERPLATE_MIN_PAGES pages)
+EDGE_LINES = 3
+BOILERPLATE_SHARE = 0.5
+BOILERPLATE_MIN_PAGES = 3
+# Opt-in: a "Sources" line can head a slide as well as a bibliography
+DROP_REFERENCES = os.getenv("EDUSAGE_DROP_REFERENCES", "0") == "1"
+# Reflowed lines stay well under a retrieval passage (see retrieval.py)
+REFLOW_MAX_CHARS = 400
+
+CLEAN_CACHE = TextCache("clean", max_items=32)
+
+_PAGE_NUMBER = re.compile(r"^(page\s*)?(\d{1,4}|[ivx]{1,6})(\s*(of|/)\s*\d+)?$|^[-–—]\s*\d+\s*[-–—]$", re.I)
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"[ \t ]+")
+_REFERENCES = re.compile(r"^(\d+\.?\s*)?(references|bibliography|works cited|literature cited|sources)\s*:?$", re.I)
+# A reference list ends at the next heading-like line (short, capitalized,
+# no sentence punctuation or year) or at the end of its page, unless the
+# next page goes on with numbered or "Author, A." entries
+_HEADING = re.compile(r"^(\d+(\.\d+)*\.?\s+)?[A-Z](?!.*\b(1[5-9]|20)\d\d\b)[^.!?\[\]]{0,60}$")
+_REFERENCE_ENTRY = re.compile(r"^(\[\d+\]|\d+\.\s+[A-Z][\w'-]+,\s*[A-Z]\.|[A-Z][\w'-]+,\s*[A-Z]\.)")
+_LIST_ITEM = re.compile(r"^([-•*▪●◦–]|\d+[.)]|[a-z][.)]|[ivx]+[.)])\s", re.I)
+_SENTENCE_END = re.compile(r"[.!?:;)\"”]$")
+
+
+def _signature(line):
+    # Running headers often differ only by the page or chapter number
+    return _DIGITS.sub("#", line.lower())
+
+
+def _boilerplate(pages):
+    """Signatures of lines that repeat at the top or bottom of many pages."""
+    counts = Counter()
+    for lines in pages:
+        edges = set(lines[:EDGE_LINES]) | set(lines[-EDGE_LINES:])
+        counts.update({_signature(line) for line in edges if line})
+    needed = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_SHARE * len(pages))
+    return {signature for signature, count in counts.items() if count >= needed}
+
+
+def _strip_edges(lines, boilerplate, stats):
+    def removable(line):
+        if not line:
+            return True
+        if _PAGE_NUMBER.match(line):
+            stats["page_numbers"] += 1
+            return True
+        if _signature(line) in boilerplate:
+            stats["boilerplate_lines"] += 1
+            return True
+        return False
+
+    start = 0
+    while start < min(EDGE_LINES, len(lines)) and removable(lines[start]):
+        start += 1
+    end = len(lines)
+    while end > start and len(lines) - end < EDGE_LINES and removable(lines[end - 1]):
+        end -= 1
+    return lines[start:end]
+
+
+def _reflow(lines, stats):
+    """Joins hyphenated words and lines wrapped in the middle of a sentence."""
+    out = []
+    for line in lines:
+        if out and line:
+            previous = out[-1]
+            if previous.endswith("-") and len(previous) > 1 and previous[-2].isalpha() and line[0].islower():
+                out[-1] = previous[:-1] + line
+                stats["hyphenations"] += 1
+                continue
+            if (
+                previous
+                and not _SENTENCE_END.search(previous)
+                and line[0].islower()
+                and not _LIST_ITEM.match(line)
+                and len(previous) + len(line) < REFLOW_MAX_CHARS
+            ):
+                out[-1] = f"{previous} {line}"
+                stats["joined_lines"] += 1
+                continue
+        out.append(line)
+    return out
+
+
+def preprocess(text, drop_references=None):
+    """
+    Cleans extracted text (pages separated by blank lines, as produced by
+    utils.extract_pdf_text) before it goes into prompts: drops running
+    headers/footers and page numbers, rejoins hyphenated and wrapped lines,
+    collapses whitespace runs and, optionally (DROP_REFERENCES), drops the
+    reference list.
+    Returns (cleaned text, stats).
+    """
+    drop_references = DROP_REFERENCES if drop_references is None else drop_references
+    stats = Counter(boilerplate_lines=0, page_numbers=0, hyphenations=0, joined_lines=0, reference_lines=0)
+
+    pages = [
+        [_SPACES.sub(" ", line).strip() for line in page.split("\n")]
+        for page in text.split("\n\n")
+    ]
+    boilerplate = _boilerplate(pages) if len(pages) >= BOILERPLATE_MIN_PAGES else set()
+
+    cleaned = []
+    in_references = False
+    for number, lines in enumerate(pages):
+        lines = _strip_edges(lines, boilerplate, stats)
+        if drop_references:
+            kept = []
+            first = next((line for line in lines if line), "")
+            in_references = in_references and bool(_REFERENCE_ENTRY.match(first))
+            for line in lines:
+                # Only a heading in the last third of the document starts the references
+                if _REFERENCES.match(line) and number >= len(pages) * 2 / 3:
+                    in_references = True
+                    stats["reference_lines"] += 1
+                    continue
+                if in_references and _HEADING.match(line) and not _REFERENCE_ENTRY.match(line):
+                    in_references = False
+                if in_references:
+                    stats["reference_lines"] += 1
+                else:
+                    kept.append(line)
+            lines = kept
+        lines = [line for line in _reflow(lines, stats) if line]
+        if lines:
+            cleaned.append("\n".join(lines))
+
+    result = "\n\n".join(cleaned)
+    stats["tokens_before"] = estimate_tokens(text)
+    stats["tokens_after"] = estimate_tokens(result)
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    return result, dict(stats)
+
+
+def cached_preprocess(text):
+    """
+    preprocess() memoized on the document's content hash, so every feature
+    (and every rerun) reuses one cleaned copy. Returns the cleaned text.
+    """
+    key = hash_bytes(f"{PREPROCESS_VERSION}\0{DROP_REFERENCES}\0{text}".encode("utf-8"))
+    cleaned = CLEAN_CACHE.get(key)
+    if cleaned is None:
+        with metrics.timer("preprocess"):
+            cleaned, stats = preprocess(text)
+        metrics.inc("edusage_preprocess_tokens_saved_total", stats["tokens_saved"])
+        CLEAN_CACHE.put(key, cleaned)
+    return cleaned
@@ -0,0 +1,202 @@
+import json
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+import metrics
+from cache import CACHE_DIR, CHARS_PER_TOKEN, estimate_tokens, hash_bytes
+
+INDEX_DIR = os.path.join(CACHE_DIR, "retrieval")
+INDEX_VERSION = 1  # bump when tokenization or passage splitting changes
+
+# Passages are packed from whole lines up to this size; prompts built from
+# them get at most RETRIEVAL_BUDGET tokens of document text
+PASSAGE_TOKENS = int(os.getenv("EDUSAGE_PASSAGE_TOKENS", 200))
+RETRIEVAL_BUDGET = int(os.getenv("EDUSAGE_RETRIEVAL_BUDGET", 8000))
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be been but by can for from has have if in into is it its
+not of on or so such that the their then there these they this to was were
+which will with we our you your he she his her them than also may more most
+""".split())
+
+
+def tokenize(text):
+    return [w for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+def split_passages(text, max_tokens=None):
+    """
+    Packs consecutive lines into passages of about max_tokens, starting a
+    new passage at page boundaries (blank lines) once the current one is
+    at least half full.
+    """
+    max_chars = (max_tokens or PASSAGE_TOKENS) * CHARS_PER_TOKEN
+    passages = []
+    current = []
+    size = 0
+    for page in text.split("\n\n"):
+        if size >= max_chars // 2:
+            passages.append("\n".join(current))
+            current, size = [], 0
+        for line in page.split("\n"):
+            while len(line) > max_chars:
+                if current:
+                    passages.append("\n".join(current))
+                    current, size = [], 0
+                passages.append(line[:max_chars])
+                line = line[max_chars:]
+            if current and size + len(line) > max_chars:
+                passages.append("\n".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+    if current:
+        passages.append("\n".join(current))
+    return [p for p in passages if p.strip()]
+
+
+class Index:
+    """
+    BM25 index over one document's passages. Term weights are precomputed
+    into a sparse passage x term matrix, so a query is one sparse product.
+    """
+
+    def __init__(self, passages, vocabulary, weights):
+        self.passages = passages
+        self.vocabulary = vocabulary
+        self.weights = weights
+
+    @classmethod
+    def build(cls, text):
+        passages = split_passages(text)
+        vocabulary = {}
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(passages))
+        for row, passage in enumerate(passages):
+            terms = Counter(tokenize(passage))
+            lengths[row] = sum(terms.values())
+            for term, count in terms.items():
+                rows.append(row)
+                cols.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+
+        shape = (len(passages), len(vocabulary))
+        tf = sparse.csr_matrix((np.array(counts, dtype=np.float32), (rows, cols)), shape=shape)
+        df = np.bincount(tf.indices, minlength=shape[1])
+        idf = np.log1p((shape[0] - df + 0.5) / (df + 0.5))
+
+        # tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avglen)), times idf
+        norm = K1 * (1 - B + B * lengths / max(lengths.mean(), 1.0)) if shape[0] else lengths
+        weights = tf.copy()
+        weights.data = weights.data * (K1 + 1) / (weights.data + np.repeat(norm, np.diff(tf.indptr)))
+        weights = weights.multiply(idf).tocsr().astype(np.float32)
+        return cls(passages, vocabulary, weights)
+
+    def scores(self, query):
+        columns = [self.vocabulary[t] for t in set(tokenize(query)) if t in self.vocabulary]
+        if not columns or not self.passages:
+            return np.zeros(len(self.passages))
+        return np.asarray(self.weights[:, columns].sum(axis=1)).ravel()
+
+    def search(self, query, k=10):
+        """Returns [(passage number, score)] for the k best matches."""
+        scores = self.scores(query)
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def select(self, queries, budget_tokens=None):
+        """
+        Picks passages for several queries in turn (best remaining match for
+        each query, round-robin) until budget_tokens is spent, and returns
+        them in document order, so every query is covered.
+        """
+        budget = (budget_tokens or RETRIEVAL_BUDGET) * CHARS_PER_TOKEN
+        rankings = [np.argsort(-self.scores(q), kind="stable") for q in queries]
+        positions = [0] * len(rankings)
+        chosen = set()
+        used = 0
+        while any(pos < len(ranking) for pos, ranking in zip(positions, rankings)):
+            for n, ranking in enumerate(rankings):
+                # Next passage for this query that isn't taken and still fits
+                while positions[n] < len(ranking):
+                    number = int(ranking[positions[n]])
+                    positions[n] += 1
+                    size = len(self.passages[number]) + 2
+                    if number not in chosen and used + size <= budget:
+                        chosen.add(number)
+                        used += size
+                        break
+        return "\n\n".join(self.passages[i] for i in sorted(chosen))
+
+    # ---------------------- PERSISTENCE ----------------------
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        sparse.save_npz(f"{tmp}.npz", self.weights)
+        with open(f"{tmp}.json", "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "passages": self.passages, "vocabulary": self.vocabulary}, f)
+        os.replace(f"{tmp}.npz", f"{path}.npz")
+        os.replace(f"{tmp}.json", f"{path}.json")
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_VERSION:
+                return None
+            weights = sparse.load_npz(f"{path}.npz").tocsr()
+        except (OSError, ValueError):
+            return None
+        return cls(meta["passages"], meta["vocabulary"], weights)
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+MAX_INDEXES = 16
+
+
+def get_index(text):
+    """The index for a document, from memory, from disk or freshly built."""
+    digest = hash_bytes(text.encode("utf-8"))
+    with _lock:
+        if digest in _indexes:
+            _indexes.move_to_end(digest)
+            return _indexes[digest]
+
+    path = os.path.join(INDEX_DIR, digest)
+    index = Index.load(path)
+    if index is None:
+        with metrics.timer("retrieval_build"):
+            index = Index.build(text)
+        try:
+            index.save(path)
+        except OSError:
+            pass
+
+    with _lock:
+        _indexes[digest] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def focus(text, queries, budget_tokens=None):
+    """
+    Document text for a focused prompt: unchanged when it already fits in
+    budget_tokens, otherwise the passages that best match `queries`.
+    """
+    budget = budget_tokens or RETRIEVAL_BUDGET
+    if estimate_tokens(text) < budget:
+        return text
+    return get_index(text).select(queries, budget)
@@ -0,0 +1,134 @@
+"""
+Document revisions. Every upload is recorded with a hash per page of its
+(cleaned) text and linked to the user's previous upload of the same
+document, matched by file name and shared pages, so a revised lecture can
+say which pages changed. A document too long for one prompt is mapped in
+small chunks whose boundaries follow page content (see nlp.chunk_text);
+a revision of it is chunked the same way, so the map prompts of unchanged
+pages repeat and are answered from the response cache. Revisions of a
+document that went out as one prompt stay one prompt: there are no chunk
+responses to reuse.
+"""
+import json
+import os
+import re
+import time
+from difflib import SequenceMatcher
+
+from cache import hash_bytes
+from db import DATABASE
+
+# A previous upload counts as the same document when its name is at least
+# NAME_MATCH similar and it shares CONTENT_MATCH of the pages, or when it
+# shares SAME_CONTENT of the pages whatever its name
+NAME_MATCH = 0.75
+CONTENT_MATCH = 0.3
+SAME_CONTENT = 0.7
+CANDIDATES = 50  # most recent uploads compared against
+
+# Version markers dropped before names are compared: "v2", "rev 3",
+# "final", "(1)", "copy" and dates
+_VERSION = re.compile(
+    r"\b(v|ver|version|rev|revision|draft)[\s_-]*\d+\b|\b(final|updated|new|copy)\b|\(\d+\)|\b\d{4} ?\d{2} ?\d{2}\b",
+    re.I,
+)
+_SEPARATORS = re.compile(r"[\s_.-]+")
+
+
+def page_hashes(text):
+    """One hash per page of text (pages are separated by blank lines)."""
+    return [hash_bytes(page.encode("utf-8"))[:16] for page in text.split("\n\n")]
+
+
+def normalize_name(name):
+    stem = _SEPARATORS.sub(" ", os.path.splitext(os.path.basename(name))[0].lower())
+    return _SEPARATORS.sub(" ", _VERSION.sub(" ", stem)).strip()
+
+
+def shared_pages(old, new):
+    """Share of the new document's pages that also appear in the old one."""
+    if not new:
+        return 0.0
+    remaining = {}
+    for digest in old:
+        remaining[digest] = remaining.get(digest, 0) + 1
+    shared = 0
+    for digest in new:
+        if remaining.get(digest):
+            remaining[digest] -= 1
+            shared += 1
+    return shared / len(new)
+
+
+def changed_pages(old, new):
+    """1-based numbers of the pages in `new` that are not in `old` at the same place in the sequence."""
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    changed = []
+    for op, _, _, start, stop in matcher.get_opcodes():
+        if op in ("replace", "insert"):
+            changed.extend(range(start + 1, stop + 1))
+    return changed
+
+
+def _match(rows, name, pages):
+    best, best_score = None, 0.0
+    normalized = normalize_name(name)
+    for row in rows:
+        old = json.loads(row["pages"])
+        content = shared_pages(old, pages)
+        similar = SequenceMatcher(None, normalize_name(row["name"]), normalized).ratio()
+        if content >= SAME_CONTENT or (similar >= NAME_MATCH and content >= CONTENT_MATCH):
+            score = content + similar
+            if score > best_score:
+                best, best_score = row, score
+    return best
+
+
+def record(username, name, source, text, chunked=False):
+    """
+    Records an upload (idempotent per user and PDF hash) and returns
+    {"id", "pages", "parent", "parent_name", "parent_created", "changed",
+    "incremental"}. parent is the previous upload of the same document, or
+    None; changed lists the pages that differ from it. `chunked` says the
+    upload is generated in chunks anyway (it is over nlp.CHUNK_TOKENS);
+    incremental is True when the parent was, so this revision should be
+    chunked too (nlp's incremental=True) to reuse the parent's responses.
+    """
+    pages = page_hashes(text)
+    with DATABASE.connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM documents WHERE username=? AND source=?", (str(username), source)
+        ).fetchone()
+        if row is None or json.loads(row["pages"]) != pages:
+            rows = conn.execute(
+                "SELECT * FROM documents WHERE username=? AND source!=? ORDER BY created DESC LIMIT ?",
+                (str(username), source, CANDIDATES),
+            ).fetchall()
+            parent = _match(rows, name, pages)
+            # Text extracted early (from the first pages only) is recorded
+            # again once the whole document is in
+            conn.execute(
+                "INSERT INTO documents (username, name, source, pages, parent, chunked, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (username, source) DO UPDATE SET "
+                "name=excluded.name, pages=excluded.pages, parent=excluded.parent, chunked=excluded.chunked",
+                (str(username), name, source, json.dumps(pages), parent["id"] if parent else None,
+                 int(bool(chunked or (parent and parent["chunked"]))), time.time()),
+            )
+            row = conn.execute(
+                "SELECT * FROM documents WHERE username=? AND source=?", (str(username), source)
+            ).fetchone()
+        parent = None
+        if row["parent"] is not None:
+            parent = conn.execute("SELECT * FROM documents WHERE id=?", (row["parent"],)).fetchone()
+
+    return {
+        "id": row["id"],
+        "pages": len(pages),
+        "parent": parent["id"] if parent else None,
+        "parent_name": parent["name"] if parent else None,
+        "parent_created": parent["created"] if parent else None,
+        "changed": changed_pages(json.loads(parent["pages"]), pages) if parent else list(range(1, len(pages) + 1)),
+        "incremental": bool(parent and parent["chunked"]),
+    }
+
@@ -0,0 +1,370 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from io import BytesIO
+
+import metrics
+from cache import hash_bytes
+from db import DATABASE
+from utils import cached_export
+
+logger = logging.getLogger(__name__)
+
+USER_FILES = "user_files"
+PREVIEW_BYTES = 4096
+
+# Content-addressed blobs shared by every user. User files are hard links
+# to these (copies where links are not supported), so identical exports
+# are stored once. MAX_VERSIONS past versions are kept per user file.
+BLOBS_DIR = os.path.join(USER_FILES, ".blobs")
+MAX_VERSIONS = int(os.getenv("EDUSAGE_MAX_VERSIONS", 20))
+# Storing a blob and recording it is serialized against garbage collection
+# in this process. Saves in other processes (e.g. batch.py) are covered by
+# never collecting a blob that is still linked into a user folder, and by
+# storing the blob again when it is collected before it could be linked.
+_blob_lock = threading.Lock()
+
+# Directory mtimes seen at the last reconcile, per user. Files written,
+# renamed or deleted through this module update the artifact index directly;
+# the mtime only tells us when something else touched the folder.
+_dir_mtimes = {}
+_dir_lock = threading.Lock()
+
+# Files (and their formats) saved for each generated artifact,
+# keyed like st.session_state.generated
+EXPORTS = {
+    "notes": [("notes.docx", "docx")],
+    "ppt": [("slides.pptx", "pptx")],
+    "sections": [("section_summaries.pdf", "pdf")],
+    "questions_mcq": [("questions.docx", "docx")],
+    "questions_written": [
+        ("written_answer_questions.docx", "docx"),
+        ("written_answer_questions.pdf", "pdf"),
+    ],
+    "assignments": [
+        ("assignments_all_groups.docx", "docx"),
+        ("assignments_all_groups.pdf", "pdf"),
+    ],
+}
+
+# Artifact type and export format of each export file name
+KINDS = {filename: key for key, files in EXPORTS.items() for filename, _ in files}
+FORMATS = {filename: fmt for files in EXPORTS.values() for filename, fmt in files}
+
+
+def user_dir(username):
+    return os.path.join(USER_FILES, str(username))
+
+
+def _as_bytes(content):
+    if isinstance(content, BytesIO):
+        return content.getvalue()
+    if isinstance(content, (bytes, bytearray)):
+        return bytes(content)
+    try:
+        return content.read()
+    except Exception:
+        return str(content).encode("utf-8")
+
+
+def blob_path(digest):
+    return os.path.join(BLOBS_DIR, digest[:2], digest)
+
+
+def _store_blob(data):
+    digest = hash_bytes(data)
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return digest
+
+
+def _link_blob(digest, path):
+    # Swap the new link in atomically; writing through an existing link
+    # would modify the shared blob for every user
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(blob_path(digest), tmp)
+    except OSError:
+        shutil.copyfile(blob_path(digest), tmp)
+    os.replace(tmp, path)
+    if os.path.lexists(tmp):
+        # rename() does nothing when path already links to the same blob
+        os.remove(tmp)
+
+
+@metrics.timed("save_user_file")
+def save_user_file(username, filename, content, source=None):
+    """
+    Stores content in the blob store, links it into the user's folder and
+    records it in the artifact index and version history. The blobs it
+    replaces or trims from the history are collected if nothing else uses them.
+    """
+    directory = user_dir(username)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    data = _as_bytes(content)
+    with _blob_lock:
+        digest = _store_blob(data)
+        try:
+            _link_blob(digest, path)
+        except FileNotFoundError:
+            # Collected by another process between the two steps
+            _store_blob(data)
+            _link_blob(digest, path)
+        released = {_record(username, filename, path, source, digest)}
+        released.update(_add_version(username, filename, source, digest, len(data)))
+    released -= {digest, None}
+    if released:
+        collect_garbage(released)
+    return path
+
+
+def save_exports(username, key, text, source=None):
+    """Renders generated text to every export format of its feature."""
+    for filename, fmt in EXPORTS[key]:
+        try:
+            save_user_file(username, filename, cached_export(fmt, text, key), source)
+        except Exception:
+            # One format failing shouldn't lose the others
+            metrics.inc("edusage_errors_total", stage="save_exports")
+            logger.exception("Saving %s for user %s failed", filename, username)
+
+
+# ---------------------- ARTIFACT INDEX ----------------------
+def _record(username, filename, path, source=None, blob=None):
+    """Indexes a file; returns the blob it had before, or None."""
+    st = os.stat(path)
+    with DATABASE.connection() as conn:
+        row = conn.execute(
+            "SELECT blob FROM artifacts WHERE username=? AND filename=?", (str(username), filename)
+        ).fetchone()
+        # A file rewritten without a known source keeps the one it had
+        conn.execute(
+            "INSERT INTO artifacts (username, filename, kind, source, path, size, mtime, blob) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (username, filename) DO UPDATE SET "
+            "source=COALESCE(excluded.source, source), path=excluded.path, "
+            "size=excluded.size, mtime=excluded.mtime, blob=excluded.blob",
+            (str(username), filename, KINDS.get(filename), source, path, st.st_size, st.st_mtime, blob),
+        )
+    return row["blob"] if row else None
+
+
+def list_artifacts(username):
+    with DATABASE.connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM artifacts WHERE username=? ORDER BY filename", (str(username),)
+        ).fetchall()
+    return [dict(row, name=row["filename"]) for row in rows]
+
+
+def reconcile(username):
+    """Brings the index in line with files added, changed or removed outside the app."""
+    directory = user_dir(username)
+    os.makedirs(directory, exist_ok=True)
+
+    on_disk = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file():
+                on_disk[entry.name] = (entry.path, entry.stat())
+
+    with DATABASE.connection() as conn:
+        indexed = {
+            row["filename"]: (row["size"], row["mtime"])
+            for row in conn.execute(
+                "SELECT filename, size, mtime FROM artifacts WHERE username=?", (str(username),)
+            )
+        }
+        for name in indexed.keys() - on_disk.keys():
+            conn.execute("DELETE FROM artifacts WHERE username=? AND filename=?", (str(username), name))
+        for name, (path, st) in on_disk.items():
+            if indexed.get(name) != (st.st_size, st.st_mtime):
+                conn.execute(
+                    "INSERT INTO artifacts (username, filename, kind, path, size, mtime) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (username, filename) DO UPDATE SET "
+                    "path=excluded.path, size=excluded.size, mtime=excluded.mtime, blob=NULL",
+                    (str(username), name, KINDS.get(name), path, st.st_size, st.st_mtime),
+                )
+
+
+# ---------------------- VERSIONS ----------------------
+def _add_version(username, filename, source, blob, size):
+    """Adds a version and trims the history to MAX_VERSIONS; returns the blobs of the trimmed ones."""
+    with DATABASE.connection() as conn:
+        conn.execute(
+            "INSERT INTO versions (username, filename, kind, source, blob, size, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (str(username), filename, KINDS.get(filename), source, blob, size, time.time()),
+        )
+        old = "FROM versions WHERE username=? AND filename=? AND id NOT IN " \
+              "(SELECT id FROM versions WHERE username=? AND filename=? ORDER BY created DESC LIMIT ?)"
+        params = (str(username), filename, str(username), filename, MAX_VERSIONS)
+        trimmed = {row[0] for row in conn.execute(f"SELECT blob {old}", params)}
+        conn.execute(f"DELETE {old}", params)
+    return trimmed
+
+
+def list_versions(username, filename=None, kind=None, source=None):
+    """Version history, newest first, filtered by file name, type or source PDF hash."""
+    clauses = ["username=?"]
+    params = [str(username)]
+    for column, value in (("filename", filename), ("kind", kind), ("source", source)):
+        if value is not None:
+            clauses.append(f"{column}=?")
+            params.append(value)
+
+    with DATABASE.connection() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM versions WHERE {' AND '.join(clauses)} ORDER BY created DESC", params
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def restore_version(username, version_id):
+    """Makes a past version the current file again; no re-rendering needed."""
+    with DATABASE.connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM versions WHERE id=? AND username=?", (version_id, str(username))
+        ).fetchone()
+    if row is None:
+        return None
+
+    path = os.path.join(user_dir(username), row["filename"])
+    os.makedirs(user_dir(username), exist_ok=True)
+    with _blob_lock:
+        if not os.path.exists(blob_path(row["blob"])):
+            return None
+        _link_blob(row["blob"], path)
+        _record(username, row["filename"], path, row["source"], row["blob"])
+    return path
+
+
+def _blob_names():
+    if not os.path.isdir(BLOBS_DIR):
+        return
+    for prefix in os.listdir(BLOBS_DIR):
+        for name in os.listdir(os.path.join(BLOBS_DIR, prefix)):
+            if not name.endswith(".tmp"):
+                yield name
+
+
+def collect_garbage(blobs=None):
+    """
+    Deletes blobs that no current file or kept version refers to; returns
+    bytes freed. Only the given blob digests are considered, or the whole
+    store when blobs is None (e.g. to clean up after files were removed
+    outside the app).
+    """
+    freed = 0
+    with _blob_lock:
+        with DATABASE.connection() as conn:
+            if blobs is None:
+                referenced = {
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT blob FROM artifacts WHERE blob IS NOT NULL "
+                        "UNION SELECT blob FROM versions WHERE blob IS NOT NULL"
+                    )
+                }
+                candidates = set(_blob_names()) - referenced
+            else:
+                candidates = {
+                    digest for digest in blobs
+                    if not conn.execute(
+                        "SELECT 1 FROM artifacts WHERE blob=? UNION ALL SELECT 1 FROM versions WHERE blob=? LIMIT 1",
+                        (digest, digest),
+                    ).fetchone()
+                }
+
+        for digest in candidates:
+            path = blob_path(digest)
+            try:
+                st = os.stat(path)
+                if st.st_nlink == 1:
+                    os.remove(path)
+                    freed += st.st_size
+            except OSError:
+                pass
+    return freed
+
+
+def scan_user_files(username):
+    """
+    Returns metadata dicts (name, path, size, mtime, kind, source) for a
+    user's files from the artifact index. The folder is only rescanned when
+    its mtime shows something outside the app changed it.
+    """
+    directory = user_dir(username)
+    os.makedirs(directory, exist_ok=True)
+    dir_mtime = os.stat(directory).st_mtime_ns
+
+    with _dir_lock:
+        stale = _dir_mtimes.get(str(username)) != dir_mtime
+    if stale:
+        reconcile(username)
+        with _dir_lock:
+            _dir_mtimes[str(username)] = dir_mtime
+    return list_artifacts(username)
+
+
+def read_head(path, limit=PREVIEW_BYTES):
+    """Reads at most the first `limit` characters of a text file for previews."""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read(limit)
+
+
+def read_user_file(username, filename):
+    with open(os.path.join(user_dir(username), os.path.basename(filename)), "rb") as f:
+        return f.read()
+
+
+def rename_user_file(username, filename, new_name):
+    """Renames a user's file; returns False if the new name is taken."""
+    directory = user_dir(username)
+    new_path = os.path.join(directory, os.path.basename(new_name))
+    if os.path.exists(new_path):
+        return False
+    filename = os.path.basename(filename)
+    new_name = os.path.basename(new_name)
+    os.rename(os.path.join(directory, filename), new_path)
+
+    with DATABASE.connection() as conn:
+        conn.execute("DELETE FROM artifacts WHERE username=? AND filename=?", (str(username), new_name))
+        conn.execute(
+            "UPDATE artifacts SET filename=?, kind=?, path=?, mtime=? WHERE username=? AND filename=?",
+            (new_name, KINDS.get(new_name), new_path, os.stat(new_path).st_mtime, str(username), filename),
+        )
+        # The history follows the file, replacing any left by a deleted file of the new name
+        conn.execute("DELETE FROM versions WHERE username=? AND filename=?", (str(username), new_name))
+        conn.execute(
+            "UPDATE versions SET filename=?, kind=? WHERE username=? AND filename=?",
+            (new_name, KINDS.get(new_name), str(username), filename),
+        )
+    return True
+
+
+def delete_user_file(username, filename):
+    filename = os.path.basename(filename)
+    os.remove(os.path.join(user_dir(username), filename))
+
+    with DATABASE.connection() as conn:
+        blobs = {
+            row[0]
+            for row in conn.execute(
+                "SELECT blob FROM artifacts WHERE username=? AND filename=? AND blob IS NOT NULL "
+                "UNION SELECT blob FROM versions WHERE username=? AND filename=? AND blob IS NOT NULL",
+                (str(username), filename, str(username), filename),
+            )
+        }
+        conn.execute("DELETE FROM artifacts WHERE username=? AND filename=?", (str(username), filename))
+        conn.execute("DELETE FROM versions WHERE username=? AND filename=?", (str(username), filename))
+    collect_garbage(blobs)
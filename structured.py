@@ -0,0 +1,226 @@
+"""
+Structured results for the features whose output is a list of items: MCQs,
+written questions and slide outlines. The model replies in JSON mode and
+the reply is parsed into a small dict, e.g.
+
+    {"kind": "mcq", "questions": [{"question": "...", "options": ["..."] * 4, "answer": "B"}]}
+    {"kind": "written", "questions": [{"type": "short", "question": "..."}]}
+    {"kind": "slides", "slides": [{"title": "...", "bullets": ["..."]}]}
+
+so single items can be regenerated and exporters can render the structure
+instead of re-parsing free text.
+"""
+import json
+import re
+
+# Feature key -> kind of structured result
+FEATURE_KINDS = {
+    "questions_mcq": "mcq",
+    "questions_written": "written",
+    "ppt": "slides",
+}
+# Where each kind keeps its items
+ITEMS = {
+    "mcq": "questions",
+    "written": "questions",
+    "slides": "slides",
+}
+
+# Gemini generation_config for JSON-mode replies
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+LETTERS = "ABCDEFGH"
+WRITTEN_TYPES = {
+    "very short": "Very short answer questions",
+    "short": "Short answer questions",
+    "long": "Long answer / essay questions",
+}
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_OPTION_LABEL = re.compile(r"^\(?[A-Ha-h][.):]\s+")
+_ANSWER = re.compile(r"^(?:option\s+)?\(?([A-H])\)?(?:[.):\s]|$)", re.I)
+
+
+def _text(value):
+    return " ".join(str(value).split()) if isinstance(value, (str, int, float)) else ""
+
+
+def _mcq(item):
+    question = _text(item.get("question"))
+    options = item.get("options") or []
+    if isinstance(options, dict):
+        options = list(options.values())
+    options = [_OPTION_LABEL.sub("", _text(o)) for o in options if _text(o)][:len(LETTERS)]
+    if not question or len(options) < 2:
+        return None
+
+    answer = item.get("answer")
+    if isinstance(answer, int) and 0 <= answer < len(options):
+        answer = LETTERS[answer]
+    else:
+        answer = _text(answer)
+        match = _ANSWER.match(answer)
+        texts = [o.lower() for o in options]
+        if match and match.group(1).upper() in LETTERS[:len(options)]:
+            answer = match.group(1).upper()
+        elif answer.lower() in texts:
+            # An answer given as the option's text
+            answer = LETTERS[texts.index(answer.lower())]
+        else:
+            answer = ""
+    return {"question": question, "options": options, "answer": answer}
+
+
+def _written(item):
+    question = _text(item.get("question"))
+    kind = _text(item.get("type")).lower().replace("-", " ").replace("_", " ")
+    kind = next((k for k in ("very short", "short", "long") if kind.startswith(k)), "short")
+    return {"type": kind, "question": question} if question else None
+
+
+def _slide(item):
+    title = _text(item.get("title"))
+    bullets = item.get("bullets") or item.get("points") or item.get("subtopics") or []
+    lines = []
+    for bullet in bullets:
+        if isinstance(bullet, dict):
+            topic = _text(bullet.get("topic") or bullet.get("title"))
+            description = _text(bullet.get("description") or bullet.get("text"))
+            bullet = f"{topic}: {description}" if topic and description else topic or description
+        bullet = _text(bullet).lstrip("-•* ")
+        if bullet:
+            lines.append(bullet)
+    return {"title": title, "bullets": lines} if title else None
+
+
+_NORMALIZE = {"mcq": _mcq, "written": _written, "slides": _slide}
+
+
+def parse_items(kind, text):
+    """
+    Items of the given kind from a JSON reply, which may be a bare list or
+    an object holding one. Malformed items are dropped; ValueError if none
+    are left.
+    """
+    try:
+        data = json.loads(_FENCE.sub("", text.strip()))
+    except (TypeError, ValueError):
+        raise ValueError("reply is not JSON")
+    if isinstance(data, dict):
+        data = data.get(ITEMS[kind]) or next((v for v in data.values() if isinstance(v, list)), [])
+    if not isinstance(data, list):
+        raise ValueError("reply holds no list of items")
+    items = [_NORMALIZE[kind](item) for item in data if isinstance(item, dict)]
+    items = [item for item in items if item]
+    if not items:
+        raise ValueError(f"reply holds no valid {kind} items")
+    return items
+
+
+def partial_items(kind, text):
+    """
+    The items complete so far in a JSON reply that is still streaming in,
+    for previews: every whole object in the first array. Never raises.
+    """
+    start = text.find("[")
+    items = []
+    if start < 0:
+        return items
+    depth, begin, in_string, escaped = 0, None, False, False
+    for position in range(start + 1, len(text)):
+        char = text[position]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            if depth == 0:
+                begin = position
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                try:
+                    item = json.loads(text[begin:position + 1])
+                except ValueError:
+                    continue
+                item = _NORMALIZE[kind](item) if isinstance(item, dict) else None
+                if item:
+                    items.append(item)
+        elif char == "]" and depth == 0:
+            break
+    return items
+
+
+def parse(kind, text):
+    return {"kind": kind, ITEMS[kind]: parse_items(kind, text)}
+
+
+def load(feature, text):
+    """The structured result of a feature's output, or None when it has none (or it is free text)."""
+    kind = FEATURE_KINDS.get(feature)
+    if kind is None or not text:
+        return None
+    try:
+        return parse(kind, text)
+    except ValueError:
+        return None
+
+
+def dumps(model):
+    return json.dumps(model, ensure_ascii=False, separators=(",", ":"))
+
+
+def items(model):
+    return model[ITEMS[model["kind"]]]
+
+
+def label(model, index):
+    """A one-line description of an item, for pickers."""
+    item = items(model)[index]
+    if model["kind"] == "slides":
+        return f"Slide {index + 1}: {item['title']}"
+    prefix = f"[{item['type']}] " if model["kind"] == "written" else ""
+    return f"{index + 1}. {prefix}{item['question']}"
+
+
+def to_lines(model):
+    """
+    Renders a structured result as text lines: markdown-style headings and
+    lists for questions (as the PDF renderer reads them), and the
+    title-then-bullets outline format for slides.
+    """
+    kind = model["kind"]
+    if kind == "mcq":
+        for number, item in enumerate(model["questions"], 1):
+            yield f"{number}. {item['question']}"
+            for letter, option in zip(LETTERS, item["options"]):
+                yield f"- {letter}) {option}"
+            if item["answer"]:
+                yield f"Answer: {item['answer']}"
+            yield ""
+    elif kind == "written":
+        for kind_name, heading in WRITTEN_TYPES.items():
+            questions = [item for item in model["questions"] if item["type"] == kind_name]
+            if not questions:
+                continue
+            yield f"## {heading}"
+            yield ""
+            for number, item in enumerate(questions, 1):
+                yield f"{number}. {item['question']}"
+            yield ""
+    else:
+        for slide in model["slides"]:
+            yield slide["title"]
+            for bullet in slide["bullets"]:
+                yield f"- {bullet}"
+            yield ""
+
+
+def to_text(model):
+    return "\n".join(to_lines(model)).strip()
@@ -1,30 +1,235 @@
-import pdfplumber
-from pptx import Presentation
-from docx import Document
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+# pdfplumber, python-docx, python-pptx and reportlab are imported inside
+# the functions that use them: they take longer to import than the login
+# page takes to draw, and many sessions never need them.
 import io
+import multiprocessing
+import os
+import re
+import threading
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
+import metrics
+import structured
+from cache import BytesCache, TextCache, hash_bytes
+
+EXTRACT_CACHE = TextCache(
+    "extract",
+    max_items=int(os.getenv("EDUSAGE_EXTRACT_CACHE_ITEMS", 32)),
+    max_disk_bytes=int(os.getenv("EDUSAGE_EXTRACT_CACHE_MB", 256)) * 1024 * 1024,
+)
+EXPORT_CACHE = BytesCache(int(os.getenv("EDUSAGE_EXPORT_CACHE_MB", 64)) * 1024 * 1024, name="export")
 
 # ---------------------- PDF TEXT EXTRACTION ----------------------
-def extract_pdf_text(file):
-    text_pages = []
+# Process-pool extraction settings. Documents shorter than
+# PARALLEL_MIN_PAGES are not worth the cost of starting workers.
+# EXTRACT_WORKERS bounds the extraction processes of this whole process,
+# shared by every session; a call that finds none free extracts inline.
+EXTRACT_WORKERS = int(os.getenv("EDUSAGE_EXTRACT_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_PAGES = int(os.getenv("EDUSAGE_PARALLEL_MIN_PAGES", 40))
+# Each worker's first range is this many pages, so the first pages arrive
+# quickly; later ranges double up to an even share of a few per worker.
+FIRST_RANGE_PAGES = int(os.getenv("EDUSAGE_FIRST_RANGE_PAGES", 2))
+
+# Workers come from a fork server (spawn where there is none): forking the
+# multithreaded Streamlit server could copy a lock another thread holds.
+# The server preloads what workers need instead of re-running __main__.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    MP_CONTEXT = multiprocessing.get_context("forkserver")
+    MP_CONTEXT.set_forkserver_preload(["utils", "pdfplumber"])
+else:
+    MP_CONTEXT = multiprocessing.get_context("spawn")
+
+_free_workers = EXTRACT_WORKERS
+_workers_lock = threading.Lock()
+_worker_pdf = None
+
+
+def _reserve_workers(wanted):
+    global _free_workers
+    with _workers_lock:
+        granted = max(0, min(wanted, _free_workers))
+        _free_workers -= granted
+    return granted
+
+
+def _release_workers(count):
+    global _free_workers
+    with _workers_lock:
+        _free_workers += count
+
+
+def _init_extract_worker(data):
+    # Each worker opens the document once and then serves page ranges
+    import pdfplumber
+
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(io.BytesIO(data))
+
 
-    with pdfplumber.open(file) as pdf:
-        for page in pdf.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text_pages.append(extracted.strip())
+def _page_text(page):
+    extracted = page.extract_text()
+    page.close()  # drop the page's cached layout objects straight away
+    return extracted.strip() if extracted else None
+
+
+def _extract_page_range(start, stop):
+    return [
+        (number, _page_text(page))
+        for number, page in enumerate(_worker_pdf.pages[start:stop], start + 1)
+    ]
+
+
+def _page_ranges(page_count, workers):
+    # A few ranges per worker keeps the pool busy when page costs vary
+    largest = max(FIRST_RANGE_PAGES, -(-page_count // (workers * 4)))
+    size = max(FIRST_RANGE_PAGES, 1)
+    ranges = []
+    start = 0
+    while start < page_count:
+        for _ in range(workers):
+            stop = min(start + size, page_count)
+            ranges.append((start, stop))
+            start = stop
+            if start == page_count:
+                break
+        size = min(size * 2, largest)
+    return ranges
+
+
+def count_pdf_pages(file):
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(read_pdf_bytes(file))) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pdf_pages(file, start=0, workers=1):
+    """
+    Yields (page_number, text) in page order as pages are extracted,
+    starting after the first `start` pages. Page numbers are 1-based and
+    text is None for pages without a text layer.
+    With more than one worker, page ranges are extracted in a process pool
+    and each range is yielded as soon as it (and all before it) are done.
+    Workers are taken from the EXTRACT_WORKERS shared by all calls.
+    Closing the generator early cancels the ranges not yet started.
+    Timed as stage "extract_pdf_text", up to the last page or the close.
+    """
+    return metrics.timed_iter(_iter_pdf_pages(file, start, workers), "extract_pdf_text")
 
+
+def _iter_pdf_pages(file, start, workers):
+    import pdfplumber
+
+    data = read_pdf_bytes(file)
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        page_count = len(pdf.pages)
+        reserved = 0
+        if workers > 1 and page_count - start >= PARALLEL_MIN_PAGES:
+            reserved = _reserve_workers(workers)
+        if reserved <= 1:
+            _release_workers(reserved)
+            for index in range(start, page_count):
+                yield index + 1, _page_text(pdf.pages[index])
+            return
+
+    try:
+        ranges = _page_ranges(page_count - start, reserved)
+        pool = ProcessPoolExecutor(
+            max_workers=min(reserved, len(ranges)),
+            mp_context=MP_CONTEXT,
+            initializer=_init_extract_worker,
+            initargs=(data,),
+        )
+        try:
+            futures = [pool.submit(_extract_page_range, start + lo, start + hi) for lo, hi in ranges]
+            for future in futures:
+                yield from future.result()
+        finally:
+            # Don't wait for the rest of the document when the caller stops reading
+            pool.shutdown(wait=False, cancel_futures=True)
+    finally:
+        _release_workers(reserved)
+
+
+def extract_pdf_text(file, workers=None):
+    """
+    Extracts the text of every page, joined by blank lines.
+    Large documents are extracted in a process pool (see iter_pdf_pages,
+    which also times it).
+    """
+    workers = EXTRACT_WORKERS if workers is None else workers
+    text_pages = [
+        text for _, text in iter_pdf_pages(file, workers=workers) if text is not None
+    ]
     return "\n\n".join(text_pages)
 
 
+def read_pdf_bytes(file):
+    """Returns the raw bytes of a path, bytes object or (uploaded) file object."""
+    if isinstance(file, (bytes, bytearray)):
+        return bytes(file)
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    if hasattr(file, "read"):
+        file.seek(0)
+        return file.read()
+    with open(file, "rb") as f:
+        return f.read()
+
+
+def cached_extract_pdf_text(file, workers=None):
+    """
+    Same result as extract_pdf_text, but memoized on a hash of the PDF bytes
+    so reruns and repeat uploads skip the pdfplumber layout analysis.
+    """
+    data = read_pdf_bytes(file)
+    key = hash_bytes(data)
+
+    text = EXTRACT_CACHE.get(key)
+    if text is None:
+        text = extract_pdf_text(data, workers=workers)
+        EXTRACT_CACHE.put(key, text)
+    return text
+
+
 # ---------------------- EXPORT DOCX ----------------------
+def _docx_structured(doc, model):
+    from docx.shared import Pt
+
+    if model["kind"] == "mcq":
+        for number, item in enumerate(model["questions"], 1):
+            doc.add_paragraph().add_run(f"{number}. {item['question']}").bold = True
+            for letter, option in zip(structured.LETTERS, item["options"]):
+                doc.add_paragraph(f"{letter}) {option}").paragraph_format.left_indent = Pt(PDF_INDENT)
+            if item["answer"]:
+                doc.add_paragraph().add_run(f"Answer: {item['answer']}").italic = True
+    elif model["kind"] == "written":
+        for kind, heading in structured.WRITTEN_TYPES.items():
+            questions = [item for item in model["questions"] if item["type"] == kind]
+            if questions:
+                doc.add_heading(heading, level=2)
+                for number, item in enumerate(questions, 1):
+                    doc.add_paragraph(f"{number}. {item['question']}")
+    else:
+        for slide in model["slides"]:
+            doc.add_heading(slide["title"], level=2)
+            for bullet in slide["bullets"]:
+                doc.add_paragraph(bullet, style="List Bullet")
+
+
+@metrics.timed("export_docx")
 def export_docx(content):
+    """content is text (one paragraph per line) or a structured result (see structured.py)."""
+    from docx import Document
+
     doc = Document()
 
-    for para in content.split("\n"):
-        doc.add_paragraph(para)
+    if isinstance(content, dict):
+        _docx_structured(doc, content)
+    else:
+        for para in content.split("\n"):
+            doc.add_paragraph(para)
 
     buffer = io.BytesIO()
     doc.save(buffer)
@@ -33,39 +238,182 @@ def export_docx(content):
 
 
 # ---------------------- EXPORT PDF ----------------------
-def export_pdf(content):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
+PDF_MARGIN = 50
+PDF_FONT = ("Helvetica", 11)
+PDF_HEADING_FONT = ("Helvetica-Bold", 13)
+PDF_LEADING = 15
+PDF_INDENT = 18  # hanging indent for list items
+
+_HEADING = re.compile(r"^\s*(?:#{1,6}\s+(.+?)|\*\*(.+?)\*\*:?)\s*$")
+_BULLET = re.compile(r"^\s*[-*•]\s+(.*)$")
+_NUMBERED = re.compile(r"^\s*(\d+[.)])\s+(.*)$")
+
+
+def _pdf_blocks(lines):
+    """Classifies LLM output lines as (kind, marker, text) for the PDF renderer."""
+    for line in lines:
+        if not line.strip():
+            yield "blank", "", ""
+            continue
+        m = _HEADING.match(line)
+        if m:
+            yield "heading", "", m.group(1) or m.group(2)
+            continue
+        m = _BULLET.match(line)
+        if m:
+            yield "item", "•", m.group(1).replace("**", "")
+            continue
+        m = _NUMBERED.match(line)
+        if m:
+            yield "item", m.group(1), m.group(2).replace("**", "")
+            continue
+        yield "text", "", line.strip().replace("**", "")
+
+
+@lru_cache(maxsize=65536)
+def _word_width(word, font, size):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    return stringWidth(word, font, size)
+
+
+def _split_word(word, name, size, max_width):
+    """Breaks a word wider than the line (a URL, an equation) into pieces that fit."""
+    pieces = []
+    start = 0
+    used = 0.0
+    for end, char in enumerate(word):
+        w = _word_width(char, name, size)
+        if end > start and used + w > max_width:
+            pieces.append(word[start:end])
+            start, used = end, 0.0
+        used += w
+    pieces.append(word[start:])
+    return pieces
+
+
+def _wrap(text, font, max_width):
+    """Greedy word wrap by measured width; word widths are memoized."""
+    name, size = font
+    space = _word_width(" ", name, size)
+    lines = []
+    current = []
+    used = 0.0
+    for word in text.split():
+        w = _word_width(word, name, size)
+        if w > max_width:
+            if current:
+                lines.append(" ".join(current))
+            *full, word = _split_word(word, name, size, max_width)
+            lines.extend(full)
+            current = [word]
+            used = _word_width(word, name, size)
+        elif current and used + space + w > max_width:
+            lines.append(" ".join(current))
+            current = [word]
+            used = w
+        else:
+            used += (space if current else 0) + w
+            current.append(word)
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
+@metrics.timed("export_pdf")
+def export_pdf(content, sink=None):
+    """
+    Renders text to PDF with headings (markdown # or **bold** lines), bullet
+    and numbered lists, and paragraphs wrapped by measured glyph width.
+    Each page is drawn as one batched text object.
+
+    content may be a string, any iterable of lines or a structured result
+    (see structured.py). With a file-like `sink` the PDF is written there
+    instead of to a new BytesIO.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    if isinstance(content, dict):
+        lines = structured.to_lines(content)
+    else:
+        lines = content.split("\n") if isinstance(content, str) else content
+    out = sink if sink is not None else io.BytesIO()
+    c = canvas.Canvas(out, pagesize=letter)
 
     width, height = letter
-    y = height - 50  # Top margin
-
-    for line in content.split("\n"):
-        # Auto wrap text for long sentences (manual wrap at 90 chars)
-        while len(line) > 90:
-            c.drawString(50, y, line[:90])
-            line = line[90:]
-            y -= 15
-            if y < 50:
-                c.showPage()
-                y = height - 50
-
-        c.drawString(50, y, line)
-        y -= 15
-
-        if y < 50:
+    text_width = width - 2 * PDF_MARGIN
+    top = height - PDF_MARGIN
+    y = top
+    page = c.beginText()
+    page_font = None
+    cursor = None  # where the text object will draw its next line
+
+    def line_at(x, text, font):
+        nonlocal y, page, page_font, cursor
+        if y < PDF_MARGIN:
+            c.drawText(page)
             c.showPage()
-            y = height - 50
+            page = c.beginText()
+            page_font = cursor = None
+            y = top
+        if font != page_font:
+            page.setFont(*font, leading=PDF_LEADING)
+            page_font = font
+        # Only reposition when the flow jumps; otherwise T* moves down a line
+        if cursor != (x, y):
+            page.setTextOrigin(x, y)
+        page.textLine(text)
+        y -= PDF_LEADING
+        cursor = (x, y)
+
+    for kind, marker, text in _pdf_blocks(lines):
+        if kind == "blank":
+            y -= PDF_LEADING
+        elif kind == "heading":
+            if y < top:
+                y -= PDF_LEADING / 2
+            for part in _wrap(text, PDF_HEADING_FONT, text_width):
+                line_at(PDF_MARGIN, part, PDF_HEADING_FONT)
+        elif kind == "item":
+            parts = _wrap(text, PDF_FONT, text_width - PDF_INDENT) or [""]
+            line_at(PDF_MARGIN, marker, PDF_FONT)
+            y += PDF_LEADING  # the item text goes on the marker's line
+            for part in parts:
+                line_at(PDF_MARGIN + PDF_INDENT, part, PDF_FONT)
+        else:
+            for part in _wrap(text, PDF_FONT, text_width):
+                line_at(PDF_MARGIN, part, PDF_FONT)
 
+    c.drawText(page)
     c.save()
-    buffer.seek(0)
-    return buffer
+    if sink is None:
+        out.seek(0)
+    return out
 
 
 # ---------------------- EXPORT PPT ----------------------
+def _outline_slides(ppt_content):
+    """(title, bullets) pairs from an outline in the text format below."""
+    slides = []
+    for block in ppt_content.strip().split("\n\n"):
+        lines = block.strip().split("\n")
+        bullets = []
+        for line in lines[1:]:
+            if ":" in line:
+                topic, desc = line.split(":", 1)
+                bullets.append(f"{topic.strip()}: {desc.strip()}")
+            else:
+                bullets.append(line.strip())
+        slides.append((lines[0].strip(), bullets))
+    return slides
+
+
+@metrics.timed("export_ppt")
 def export_ppt(ppt_content):
     """
-    Expects ppt_content in a structured text format like:
+    Expects a structured slides result (see structured.py), or
+    ppt_content in a structured text format like:
     
     Slide Title
     - Subtopic 1: one line description
@@ -80,16 +428,14 @@ def export_ppt(ppt_content):
 
     prs = Presentation()
 
-    slides = ppt_content.strip().split("\n\n")
+    if isinstance(ppt_content, dict) and ppt_content["kind"] == "slides":
+        slides = [(slide["title"], slide["bullets"]) for slide in ppt_content["slides"]]
+    elif isinstance(ppt_content, dict):
+        slides = _outline_slides(structured.to_text(ppt_content))
+    else:
+        slides = _outline_slides(ppt_content)
     
-    for block in slides:
-        lines = block.strip().split("\n")
-        if not lines:
-            continue
-
-        # Extract title
-        title_text = lines[0].strip()
-
+    for title_text, bullets in slides:
         # Slide
         slide_layout = prs.slide_layouts[1]  # Title + content layout
         slide = prs.slides.add_slide(slide_layout)
@@ -103,18 +449,11 @@ def export_ppt(ppt_content):
         body.clear()  # Remove default bullet
 
         # Add bullet points
-        for line in lines[1:]:
-            if ":" in line:
-                topic, desc = line.split(":", 1)
-                p = body.add_paragraph()
-                p.text = f"{topic.strip()}: {desc.strip()}"
-                p.level = 0
-                p.font.size = Pt(20)
-            else:
-                p = body.add_paragraph()
-                p.text = line.strip()
-                p.level = 0
-                p.font.size = Pt(20)
+        for bullet in bullets:
+            p = body.add_paragraph()
+            p.text = bullet
+            p.level = 0
+            p.font.size = Pt(20)
 
     # Export as binary buffer
     buffer = io.BytesIO()
@@ -122,3 +461,34 @@ def export_ppt(ppt_content):
     buffer.seek(0)
     return buffer
 
+
+# ---------------------- EXPORT CACHE ----------------------
+EXPORTERS = {
+    "docx": export_docx,
+    "pdf": export_pdf,
+    "pptx": export_ppt,
+}
+
+# Bump a format's version whenever its exporter's output changes
+RENDERER_VERSIONS = {
+    "docx": 1,
+    "pdf": 3,
+    "pptx": 1,
+}
+
+
+def cached_export(fmt, content, feature=None):
+    """
+    Returns the rendered bytes of content in the given format ("docx",
+    "pdf" or "pptx"), memoized on (format, content hash, renderer version).
+    When content is the structured result of `feature` (see structured.py)
+    it is rendered from that structure.
+    The bytes are shared, not copied; wrap them in memoryview() to slice.
+    """
+    model = structured.load(feature, content)
+    key = (fmt, hash_bytes(content.encode("utf-8")), RENDERER_VERSIONS[fmt], model and feature)
+    data = EXPORT_CACHE.get(key)
+    if data is None:
+        data = EXPORTERS[fmt](content if model is None else model).getvalue()
+        EXPORT_CACHE.put(key, data)
+    return data